@@ -0,0 +1,216 @@
+import os
+import time
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from utils import cal, SLOT_MINUTES
+from data_loader import (
+    RESULT_CACHE, cache_key, day_tag, preload_open_slot, is_fallback,
+    get_tile_places, tile_of, PREFETCH_TILE_MAX_KM
+)
+
+# Peak windows (hour ranges) predicted from the SouthKorea calendar
+SUNDAY_PEAK_HOURS = (17, 24) # Sunday evenings
+HOLIDAY_PEAK_HOURS = (9, 24) # public holidays, most of the day
+
+WARM_LEAD = 60 # seconds before each peak slot starts to warm it
+WARM_TTL = SLOT_MINUTES * 60 + WARM_LEAD # warmed entries last until the next slot is warmed
+WARM_TOP_REGIONS = 20 # most frequent district searches warmed per slot
+WARM_TOP_TILES = 30 # most frequent map tiles warmed per slot
+MAX_TRACKED = 2000 # query keys kept in the frequency table
+
+ENABLED = os.getenv("CACHE_WARMER", "1") != "0"
+
+def peak_window(day):
+    """Returns the (start, end) datetimes of the peak window on a date, or None."""
+    if cal.is_holiday(day):
+        hours = HOLIDAY_PEAK_HOURS
+    elif day.weekday() == 6:
+        hours = SUNDAY_PEAK_HOURS
+    else:
+        return None
+    midnight = datetime.combine(day, datetime.min.time())
+    return midnight + timedelta(hours=hours[0]), midnight + timedelta(hours=hours[1])
+
+def in_peak(when):
+    window = peak_window(when.date())
+    return window is not None and window[0] <= when < window[1]
+
+def next_peak(now=None, days=14):
+    """The next (start, end) peak window that has not ended yet, or None."""
+    now = now or datetime.now()
+    for offset in range(days):
+        window = peak_window((now + timedelta(days=offset)).date())
+        if window and window[1] > now:
+            return window
+    return None
+
+def _slot_start(when):
+    return when.replace(minute=when.minute - when.minute % SLOT_MINUTES, second=0, microsecond=0)
+
+class QueryStats:
+    """
+    Thread-safe frequency table of what users search for. Keeps the latest
+    exact call for each key, so warming replays it with the same cache key.
+    """
+    def __init__(self, max_tracked=MAX_TRACKED):
+        self.max_tracked = max_tracked
+        self.counts = Counter()
+        self.calls = {} # key -> (func, args, kwargs)
+        self._lock = threading.Lock()
+
+    def record(self, key, func, args, kwargs):
+        with self._lock:
+            self.counts[key] += 1
+            self.calls[key] = (func, tuple(args), dict(kwargs))
+            if len(self.counts) > self.max_tracked:
+                # Drop the least requested half rather than one key per call
+                for old_key, _ in self.counts.most_common()[self.max_tracked // 2:]:
+                    del self.counts[old_key]
+                    self.calls.pop(old_key, None)
+
+    def top(self, kind, n):
+        """The n most frequent calls of a kind ("region" / "tile")."""
+        with self._lock:
+            keys = [key for key, _ in self.counts.most_common() if key[0] == kind][:n]
+            return [self.calls[key] for key in keys]
+
+QUERY_STATS = QueryStats()
+
+def record_region_query(func, *args, **kwargs):
+    """Counts a district search (e.g. get_live_region_places(city, district, type))."""
+    QUERY_STATS.record(("region",) + tuple(args), func, args, kwargs)
+
+def record_tile_query(lat, lon, radius_km, place_type="약국"):
+    """
+    Counts a radius search under its map tile. Warming fills the tile's
+    candidates (get_tile_places), which answer any radius query made from
+    inside it (data_loader.nearby_from_tiles), whatever the exact coordinates.
+    """
+    if radius_km > PREFETCH_TILE_MAX_KM:
+        return # too many candidates to keep per tile
+    args = tile_of(lat, lon) + (radius_km, place_type)
+    QUERY_STATS.record(("tile",) + args, get_tile_places, args, {})
+
+class CacheWarmer:
+    """
+    Background thread that fills RESULT_CACHE ahead of peak demand.
+    WARM_LEAD seconds before every 10-minute slot inside a peak window it
+    loads that slot's open-index bitsets, fills the candidates of the most
+    requested map tiles for the slot's day and refreshes the most requested
+    district searches that are not cached.
+    """
+    def __init__(self, stats=QUERY_STATS, cache=RESULT_CACHE):
+        self.stats = stats
+        self.cache = cache
+        self.runs = 0
+        self.warmed = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.last_run = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="cache-warmer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _next_run(self, now):
+        """(run_at, slot_start) for the next slot that has not been warmed."""
+        slot_start = _slot_start(now) + timedelta(minutes=SLOT_MINUTES)
+        run_at = slot_start - timedelta(seconds=WARM_LEAD)
+        return max(run_at, now), slot_start
+
+    def _loop(self):
+        while True:
+            run_at, slot_start = self._next_run(datetime.now())
+            if self._stop.wait((run_at - datetime.now()).total_seconds()):
+                return
+            if in_peak(slot_start):
+                self.warm(slot_start)
+            # Don't warm the same slot twice if the run finished early
+            self._stop.wait(max(0.0, (slot_start - datetime.now()).total_seconds()))
+
+    def warm(self, slot_start):
+        """Warms the caches for the slot starting at slot_start. Returns entries warmed."""
+        started = time.monotonic()
+        warmed = 0
+
+        try:
+            preload_open_slot(slot_start)
+        except Exception as e:
+            self.errors += 1
+            print(f"Error warming open index: {e}")
+
+        for func, args, kwargs in self.stats.top("tile", WARM_TOP_TILES):
+            # Tiles hold every candidate (open status is applied on read), keyed
+            # like nearby_from_tiles looks them up: by the day whose hours they load
+            key = cache_key(func, args, kwargs, day_tag(slot_start))
+            warmed += self._warm_entry(key, func, args, dict(kwargs, current_datetime=slot_start))
+
+        for func, args, kwargs in self.stats.top("region", WARM_TOP_REGIONS):
+            warmed += self._warm_entry(cache_key(func, args, kwargs, day_tag()), func, args, kwargs)
+
+        elapsed = time.monotonic() - started
+        self.runs += 1
+        self.warmed += warmed
+        self.seconds += elapsed
+        self.last_run = datetime.now()
+        report = self.report()
+        print(f"[cache warmer] {slot_start:%Y-%m-%d %H:%M} slot: {warmed} entries in {elapsed:.1f}s, "
+              f"hit rate {report['hit_rate']:.0%} ({report['warm_hits']} hits on warmed entries)")
+        return warmed
+
+    def _warm_entry(self, key, func, args, kwargs):
+        if self.cache.contains(key):
+            return 0
+        try:
+            value = func(*args, **kwargs)
+            if is_fallback(value):
+                # A stale DB copy would outlive the outage; leave it to the live request
+                self.errors += 1
+                return 0
+            self.cache.put(key, value, ttl=WARM_TTL, warmed=True)
+            return 1
+        except Exception as e:
+            self.errors += 1
+            print(f"Error warming {func.__name__}{args}: {e}")
+            return 0
+
+    def report(self):
+        """Warm-up work done so far and the result cache hit rates."""
+        cache = self.cache.stats()
+        lookups = cache["hits"] + cache["misses"]
+        window = next_peak()
+        return {
+            "runs": self.runs,
+            "warmed": self.warmed,
+            "errors": self.errors,
+            "seconds": round(self.seconds, 2),
+            "last_run": self.last_run,
+            "next_peak": window[0] if window else None,
+            "hit_rate": cache["hits"] / lookups if lookups else 0.0,
+            "warm_hits": cache["warm_hits"],
+            "tracked_queries": len(self.stats.counts),
+        }
+
+WARMER = CacheWarmer()
+
+def start_cache_warmer():
+    """Starts the process-wide warmer once (safe to call on every script run)."""
+    if ENABLED:
+        WARMER.start()
+    return WARMER
+
+if __name__ == "__main__":
+    # Upcoming peak windows as predicted from the calendar
+    day = datetime.now().date()
+    for offset in range(30):
+        window = peak_window(day + timedelta(days=offset))
+        if window:
+            kind = "공휴일" if cal.is_holiday(window[0].date()) else "일요일"
+            print(f"{window[0]:%Y-%m-%d %a %H:%M} - {window[1]:%H:%M} ({kind})")
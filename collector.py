@@ -1,9 +1,17 @@
 import os
+import sys
 import requests
 import sqlite3
 import pandas as pd
+import numpy as np
+import zlib
+import json
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import time
+from profiling import profile_hook
+from utils import hhmm_to_minutes, split_region, unit_vector, schedule_id, SLOT_MINUTES, SLOTS_PER_DAY, NUM_SLOTS, KOREA_ADMIN_DIVISIONS
 
 # Load Environment Variables
 load_dotenv()
@@ -11,15 +19,30 @@ API_KEY = os.getenv("DATA_GO_KR_API_KEY")
 
 # Configuration
 DB_FILE = "hospital.db"
+OPEN_INDEX_FILE = "open_index.db" # Time-slot index of open places, stored next to DB_FILE
+INDEX_VERSION_KEY = "open_index_version" # dataset_meta: the open index built from these rows
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR") # Publish snapshots for replicas when set
+
+# Optional sharded layout: one DB per sido in SHARD_DIR plus a bounding-box index
+SHARD_DIR = os.getenv("SHARD_DIR")
+SHARD_INDEX = "shards.json"
+SHARD_WORKERS = 4
 NUM_OF_ROWS = 1000 # Max rows per page
 
+# Collection retries: per page, then per work unit
+REQUEST_TIMEOUT = 30 # seconds
+PAGE_RETRIES = 3
+RETRY_BACKOFF = 2 # seconds, doubled per attempt
+UNIT_ROUNDS = 3
+
 # API Endpoints
 PHARMACY_URL = "http://apis.data.go.kr/B552657/ErmctInsttInfoInqireService/getParmacyListInfoInqire"
 HOSPITAL_URL = "http://apis.data.go.kr/B552657/HsptlAsembySearchService/getHsptlMdcncListInfoInqire"
 
-def init_db():
+def init_db(db_file=None):
     """Initialize the SQLite database and create table if not exists."""
-    conn = sqlite3.connect(DB_FILE)
+    db_file = db_file or DB_FILE
+    conn = sqlite3.connect(db_file)
     cursor = conn.cursor()
     
     # Create Table
@@ -43,123 +66,642 @@ def init_db():
             dutyTime7s TEXT, dutyTime7c TEXT,
             dutyTime8s TEXT, dutyTime8c TEXT,
             
-            type TEXT
+            type TEXT,
+
+            -- Unit vector of (wgs84Lat, wgs84Lon) for SQL-side distance ranking
+            x REAL, y REAL, z REAL,
+
+            -- Id of the row's dutyTime schedule (utils.schedule_id; see build_schedules)
+            schedule_id INTEGER
+        )
+    ''')
+    _ensure_unit_vector_columns(cursor)
+    _ensure_schedule_column(cursor)
+    # Bounding box queries filter on type + latitude range
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_places_type_lat ON places (type, wgs84Lat)")
+    # Dataset version / refresh time, read by replicas
+    cursor.execute("CREATE TABLE IF NOT EXISTS dataset_meta (key TEXT PRIMARY KEY, value TEXT)")
+    # Collection checkpoints: one row per work unit (type x sido)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS collect_units (
+            unit TEXT PRIMARY KEY,
+            type TEXT,
+            sido TEXT,
+            next_page INTEGER,
+            saved INTEGER,
+            status TEXT,
+            attempts INTEGER DEFAULT 0,
+            last_error TEXT,
+            updated_at TEXT
         )
     ''')
     conn.commit()
     conn.close()
-    print(f"Database {DB_FILE} initialized.")
+    print(f"Database {db_file} initialized.")
 
-def fetch_and_save(url, type_label):
-    """Fetch data from API and upsert into database."""
-    page_no = 1
-    total_saved = 0
-    
-    print(f"--- Starting Collection for {type_label} ---")
-    
-    while True:
-        params = {
-            "serviceKey": API_KEY,
-            "numOfRows": NUM_OF_ROWS,
-            "pageNo": page_no,
-            "_type": "json"
+def _ensure_unit_vector_columns(cursor):
+    """Adds the x, y, z columns to a places table created before they existed."""
+    existing = {row[1] for row in cursor.execute("PRAGMA table_info(places)")}
+    for column in ("x", "y", "z"):
+        if column not in existing:
+            cursor.execute(f"ALTER TABLE places ADD COLUMN {column} REAL")
+
+def _ensure_schedule_column(cursor):
+    """Adds places.schedule_id to a places table created before it existed."""
+    existing = {row[1] for row in cursor.execute("PRAGMA table_info(places)")}
+    if "schedule_id" not in existing:
+        cursor.execute("ALTER TABLE places ADD COLUMN schedule_id INTEGER")
+
+def _parse_items(items, type_label):
+    """Turns API items into places rows (dicts), skipping items without hpid."""
+    processed_rows = []
+    for item in items:
+        # Essential fields check
+        if not item.get('hpid'):
+            continue
+            
+        row = {
+            "hpid": item.get('hpid'),
+            "dutyName": item.get('dutyName') or item.get('yadmNm'), # yadmNm is for hospital sometimes
+            "dutyAddr": item.get('dutyAddr') or item.get('addr'),
+            "dutyTel1": item.get('dutyTel1') or item.get('telno'),
+            "wgs84Lat": item.get('wgs84Lat') or item.get('YPos'), # Hospital API uses XPos/YPos often
+            "wgs84Lon": item.get('wgs84Lon') or item.get('XPos'),
+            "type": type_label
         }
         
+        # Time columns
+        for i in range(1, 9):
+            row[f"dutyTime{i}s"] = item.get(f"dutyTime{i}s")
+            row[f"dutyTime{i}c"] = item.get(f"dutyTime{i}c")
+        
+        # Data Cleaning: Skip invalid coordinates (optional, user said "exclude or null")
+        # We save them as None if missing, Sqlite handles text/real mix fine usually but let's be safe
+        try:
+            if row["wgs84Lat"]: row["wgs84Lat"] = float(row["wgs84Lat"])
+            if row["wgs84Lon"]: row["wgs84Lon"] = float(row["wgs84Lon"])
+        except:
+            row["wgs84Lat"] = None
+            row["wgs84Lon"] = None
+
+        row["x"], row["y"], row["z"] = unit_vector(row["wgs84Lat"], row["wgs84Lon"])
+        row["schedule_id"] = schedule_id([row[f"dutyTime{i}{end}"] for i in range(1, 9) for end in "sc"])
+        
+        processed_rows.append(row)
+    return processed_rows
+
+def _fetch_page(url, params):
+    """
+    GETs one page, retrying transient errors with exponential backoff.
+    Returns the page's items (a list, empty past the last page).
+    """
+    for attempt in range(PAGE_RETRIES):
         try:
-            response = requests.get(url, params=params)
+            response = requests.get(url, params=params, timeout=REQUEST_TIMEOUT)
             response.raise_for_status()
-            
             data = response.json()
-            items = data.get('response', {}).get('body', {}).get('items', {}).get('item')
-            
-            # Check if items exist
-            if not items:
-                print(f"No more data found at page {page_no}. Stopping.")
-                break
-                
+            items = data.get('response', {}).get('body', {}).get('items')
+            # Past the last page the API returns items as "" instead of a dict
+            items = items.get('item') if isinstance(items, dict) else None
             # Normalize to list if single item dict
             if isinstance(items, dict):
                 items = [items]
-            
-            if len(items) == 0:
-                print(f"Empty list at page {page_no}. Stopping.")
+            return items or []
+        except Exception as e:
+            if attempt == PAGE_RETRIES - 1:
+                raise
+            print(f"Page {params['pageNo']} failed ({e}), retrying...")
+            time.sleep(RETRY_BACKOFF * 2 ** attempt)
+
+def _unit_key(type_label, sido=None):
+    return f"{type_label}:{sido or '*'}"
+
+@profile_hook("fetch_and_save")
+def fetch_and_save(url, type_label, sido=None, db_file=None):
+    """
+    Fetch data from API and upsert into database.
+    sido: Optional. Collect only this province (API Q0), e.g. into its shard.
+
+    Progress is checkpointed in collect_units: every page is committed together
+    with the unit's next page number, so an interrupted or failed unit resumes
+    where it stopped. Returns True once the unit is complete.
+    """
+    db_file = db_file or DB_FILE
+    unit = _unit_key(type_label, sido)
+    label = f"{type_label} {sido}" if sido else type_label
+
+    conn = sqlite3.connect(db_file)
+    conn.execute(
+        "INSERT OR IGNORE INTO collect_units (unit, type, sido, next_page, saved, status) VALUES (?, ?, ?, 1, 0, 'pending')",
+        (unit, type_label, sido)
+    )
+    conn.commit()
+    page_no, total_saved, status = conn.execute(
+        "SELECT next_page, saved, status FROM collect_units WHERE unit = ?", (unit,)
+    ).fetchone()
+    if status == "done":
+        conn.close()
+        print(f"--- {label} already collected ({total_saved}). Skipping. ---")
+        return True
+
+    if page_no > 1:
+        print(f"--- Resuming Collection for {label} at page {page_no} ---")
+    else:
+        print(f"--- Starting Collection for {label} ---")
+
+    try:
+        while True:
+            params = {
+                "serviceKey": API_KEY,
+                "numOfRows": NUM_OF_ROWS,
+                "pageNo": page_no,
+                "_type": "json"
+            }
+            if sido:
+                params["Q0"] = sido
+
+            items = _fetch_page(url, params)
+            if not items:
+                print(f"No more data found at page {page_no}. Stopping.")
                 break
-                
-            # Process Data
-            processed_rows = []
-            for item in items:
-                # Essential fields check
-                if not item.get('hpid'):
-                    continue
-                    
-                row = {
-                    "hpid": item.get('hpid'),
-                    "dutyName": item.get('dutyName') or item.get('yadmNm'), # yadmNm is for hospital sometimes
-                    "dutyAddr": item.get('dutyAddr') or item.get('addr'),
-                    "dutyTel1": item.get('dutyTel1') or item.get('telno'),
-                    "wgs84Lat": item.get('wgs84Lat') or item.get('YPos'), # Hospital API uses XPos/YPos often
-                    "wgs84Lon": item.get('wgs84Lon') or item.get('XPos'),
-                    "type": type_label
-                }
-                
-                # Time columns
-                for i in range(1, 9):
-                    row[f"dutyTime{i}s"] = item.get(f"dutyTime{i}s")
-                    row[f"dutyTime{i}c"] = item.get(f"dutyTime{i}c")
-                
-                # Data Cleaning: Skip invalid coordinates (optional, user said "exclude or null")
-                # We save them as None if missing, Sqlite handles text/real mix fine usually but let's be safe
-                try:
-                    if row["wgs84Lat"]: row["wgs84Lat"] = float(row["wgs84Lat"])
-                    if row["wgs84Lon"]: row["wgs84Lon"] = float(row["wgs84Lon"])
-                except:
-                    row["wgs84Lat"] = None
-                    row["wgs84Lon"] = None
-                
-                processed_rows.append(row)
-            
-            if not processed_rows:
+
+            processed_rows = _parse_items(items, type_label)
+
+            # Rows and checkpoint commit together (SQLite 'INSERT OR REPLACE' is the upsert)
+            if processed_rows:
+                columns = ', '.join(processed_rows[0].keys())
+                placeholders = ', '.join(['?'] * len(processed_rows[0]))
+                conn.executemany(
+                    f"INSERT OR REPLACE INTO places ({columns}) VALUES ({placeholders})",
+                    [tuple(row.values()) for row in processed_rows]
+                )
+                # Upserts move rowids: the open index no longer matches
+                conn.execute("DELETE FROM dataset_meta WHERE key = ?", (INDEX_VERSION_KEY,))
+            else:
                 print(f"Page {page_no}: No valid rows to save.")
-                page_no += 1
-                continue
 
-            # Upsert using SQL
-            conn = sqlite3.connect(DB_FILE)
-            cursor = conn.cursor()
-            
-            # Prepare Query
-            # SQLite 'INSERT OR REPLACE' is the standard UPSERT if PK exists
-            columns = ', '.join(processed_rows[0].keys())
-            placeholders = ', '.join(['?'] * len(processed_rows[0]))
-            sql = f"INSERT OR REPLACE INTO places ({columns}) VALUES ({placeholders})"
-            
-            # Execute Batch
-            values = [tuple(row.values()) for row in processed_rows]
-            cursor.executemany(sql, values)
-            
+            total_saved += len(processed_rows)
+            conn.execute(
+                "UPDATE collect_units SET next_page = ?, saved = ?, status = 'running', updated_at = ? WHERE unit = ?",
+                (page_no + 1, total_saved, time.strftime("%Y-%m-%d %H:%M:%S"), unit)
+            )
             conn.commit()
-            conn.close()
-            
-            count = len(processed_rows)
-            total_saved += count
-            print(f"{page_no}페이지 수집 완료 ({count}건) - 누적 {total_saved}건")
-            
+            print(f"[{label}] {page_no}페이지 수집 완료 ({len(processed_rows)}건) - 누적 {total_saved}건")
+
             page_no += 1
-            
-        except Exception as e:
-            print(f"Error on page {page_no}: {e}")
-            time.sleep(2) # Retry or skip? User didn't specify. Break for safety to avoid infinite loops on auth error.
+
+    except Exception as e:
+        print(f"Error on page {page_no}: {e}")
+        conn.rollback()
+        conn.execute(
+            "UPDATE collect_units SET status = 'failed', attempts = attempts + 1, last_error = ?, updated_at = ? WHERE unit = ?",
+            (str(e), time.strftime("%Y-%m-%d %H:%M:%S"), unit)
+        )
+        conn.commit()
+        conn.close()
+        print(f"--- {label} stopped at page {page_no}; it resumes there on the next attempt. ---")
+        return False
+
+    conn.execute(
+        "UPDATE collect_units SET status = 'done', updated_at = ? WHERE unit = ?",
+        (time.strftime("%Y-%m-%d %H:%M:%S"), unit)
+    )
+    conn.commit()
+    conn.close()
+    print(f"--- {label} Collection Complete. Total Saved: {total_saved} ---")
+    return True
+
+def start_refresh(db_file=None):
+    """
+    Begins a new refresh if the previous one finished (every unit done);
+    otherwise keeps the checkpoints so the unfinished units resume.
+    """
+    conn = sqlite3.connect(db_file or DB_FILE)
+    statuses = [row[0] for row in conn.execute("SELECT status FROM collect_units")]
+    if statuses and all(status == "done" for status in statuses):
+        conn.execute("DELETE FROM collect_units")
+    elif statuses:
+        print(f"Resuming previous refresh ({statuses.count('done')}/{len(statuses)} units done).")
+    conn.commit()
+    conn.close()
+
+def collect_units(units, db_file=None, rounds=UNIT_ROUNDS):
+    """
+    Collects work units [(url, type_label, sido)]. Units that fail are retried
+    independently in later rounds, after the rest have run.
+    Returns the list of units still incomplete.
+    """
+    start_refresh(db_file)
+    remaining = list(units)
+    for round_no in range(rounds):
+        if round_no:
+            print(f"Retrying {len(remaining)} failed unit(s) (round {round_no + 1}/{rounds})...")
+            time.sleep(RETRY_BACKOFF * 2 ** round_no)
+        remaining = [unit for unit in remaining if not fetch_and_save(*unit, db_file=db_file)]
+        if not remaining:
             break
+    return remaining
+
+def region_units(sidos=None):
+    """Work units per (type, sido): each province is collected separately via Q0."""
+    sidos = list(sidos or KOREA_ADMIN_DIVISIONS)
+    return ([(PHARMACY_URL, "약국", sido) for sido in sidos]
+            + [(HOSPITAL_URL, "병원", sido) for sido in sidos])
+
+def load_schedule_arrays(conn):
+    """
+    Loads every place's opening hours as minute arrays.
+    Returns (place_ids, starts, ends) where starts/ends are (N, 8) int arrays,
+    column d-1 holding dutyTime{d}s/c in minutes since midnight (-1 if missing).
+    """
+    columns = []
+    for i in range(1, 9):
+        columns += [f"dutyTime{i}s", f"dutyTime{i}c"]
+    rows = conn.execute(f"SELECT rowid, {', '.join(columns)} FROM places").fetchall()
+
+    def to_min(value):
+        minutes = hhmm_to_minutes(value)
+        return -1 if minutes is None else minutes
+
+    place_ids = np.array([row[0] for row in rows], dtype=np.int64)
+    starts = np.array([[to_min(row[1 + 2 * d]) for d in range(8)] for row in rows], dtype=np.int32).reshape(-1, 8)
+    ends = np.array([[to_min(row[2 + 2 * d]) for d in range(8)] for row in rows], dtype=np.int32).reshape(-1, 8)
+    return place_ids, starts, ends
+
+def _pack_ids(place_ids, size):
+    """Packs place ids into a zlib-compressed little-endian bitset."""
+    mask = np.zeros(size, dtype=bool)
+    mask[place_ids] = True
+    return zlib.compress(np.packbits(mask, bitorder="little").tobytes())
+
+def build_open_index(db_file=None, index_file=None):
+    """
+    Builds the time-slot inverted index of open places (OPEN_INDEX_FILE).
+    For each 10-minute slot of the week plus the holiday profile it stores two
+    compressed bitsets of places.rowid:
+      full_bits: open for the whole slot
+      partial_bits: open for only part of the slot (needs an exact check)
+    The index and the DB get the same version id (INDEX_VERSION_KEY); any
+    later write to places removes the DB's, so readers can tell when the
+    bitsets no longer match the rowids.
+    """
+    # Stamp the DB before reading it: a write after this point unstamps it
+    index_version = uuid.uuid4().hex
+    set_dataset_meta(INDEX_VERSION_KEY, index_version, db_file)
+    conn = sqlite3.connect(db_file or DB_FILE)
+    place_ids, starts, ends = load_schedule_arrays(conn)
+    conn.close()
+
+    size = int(place_ids.max()) + 1 if len(place_ids) else 0
+    slot_rows = []
+    for slot in range(NUM_SLOTS):
+        day = slot // SLOTS_PER_DAY
+        first = (slot % SLOTS_PER_DAY) * SLOT_MINUTES
+        last = first + SLOT_MINUTES - 1
+        s_col = starts[:, day]
+        e_col = ends[:, day]
+        valid = (s_col >= 0) & (e_col >= 0)
+        # Open at minute m when start <= m <= end (same rule as is_open_now)
+        full = valid & (s_col <= first) & (e_col >= last)
+        partial = valid & ~full & (s_col <= last) & (e_col >= first)
+        slot_rows.append((slot, _pack_ids(place_ids[full], size), _pack_ids(place_ids[partial], size)))
+
+    # Build into a temp file and swap it in so readers never see a half-built index
+    index_file = index_file or OPEN_INDEX_FILE
+    tmp_file = index_file + ".tmp"
+    if os.path.exists(tmp_file):
+        os.remove(tmp_file)
+    conn = sqlite3.connect(tmp_file)
+    conn.execute("CREATE TABLE open_slots (slot INTEGER PRIMARY KEY, full_bits BLOB, partial_bits BLOB)")
+    conn.execute("CREATE TABLE open_index_meta (key TEXT PRIMARY KEY, value TEXT)")
+    conn.executemany("INSERT INTO open_slots VALUES (?, ?, ?)", slot_rows)
+    conn.executemany("INSERT INTO open_index_meta VALUES (?, ?)", [
+        ("slot_minutes", str(SLOT_MINUTES)),
+        ("num_places", str(len(place_ids))),
+        ("max_place_id", str(size - 1)),
+        ("built_at", time.strftime("%Y-%m-%d %H:%M:%S")),
+        ("db_version", index_version),
+    ])
+    conn.commit()
+    conn.close()
+    os.replace(tmp_file, index_file)
+    print(f"Open index {index_file} built ({len(place_ids)} places, {NUM_SLOTS} slots).")
+
+def build_transitions(db_file=None):
+    """
+    Precomputes each place's opening period per dutyTime day into
+    place_transitions (hpid, day, open_min, close_min), indexed by day and
+    open/close minute so "open at T", "opens soon" and "closes soon"
+    become range lookups.
+    """
+    conn = sqlite3.connect(db_file or DB_FILE)
+    place_ids, starts, ends = load_schedule_arrays(conn)
+    hpid_by_id = dict(conn.execute("SELECT rowid, hpid FROM places").fetchall())
+
+    rows = []
+    for day in range(8):
+        valid = (starts[:, day] >= 0) & (ends[:, day] >= 0) & (starts[:, day] <= ends[:, day])
+        for idx in np.flatnonzero(valid):
+            rows.append((hpid_by_id[int(place_ids[idx])], day + 1, int(starts[idx, day]), int(ends[idx, day])))
+
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS place_transitions (
+            hpid TEXT,
+            day INTEGER,
+            open_min INTEGER,
+            close_min INTEGER
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transitions_open ON place_transitions (day, open_min)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transitions_close ON place_transitions (day, close_min)")
+    # Per-place lookups for hours that continue through midnight
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transitions_hpid ON place_transitions (hpid, day)")
+    # Replace in one transaction so readers never see a partial table
+    cursor.execute("DELETE FROM place_transitions")
+    cursor.executemany("INSERT INTO place_transitions VALUES (?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+    print(f"Transitions built ({len(rows)} opening periods).")
+
+def build_search_index(db_file=None):
+    """
+    Builds the FTS5 name/address search indexes over places (external content,
+    keyed by places.rowid, so they are rebuilt after every collection run):
+      places_fts: trigram tokenizer, substring matches for terms of 3+ characters
+                  (Korean names have no word boundaries to rely on)
+      places_fts_prefix: word tokens with prefix indexes, for 1-2 character terms
+    """
+    conn = sqlite3.connect(db_file or DB_FILE)
+    cursor = conn.cursor()
+    cursor.execute("DROP TABLE IF EXISTS places_fts")
+    cursor.execute("DROP TABLE IF EXISTS places_fts_prefix")
+    cursor.execute('''
+        CREATE VIRTUAL TABLE places_fts USING fts5(
+            dutyName, dutyAddr, content='places', content_rowid='rowid', tokenize='trigram'
+        )
+    ''')
+    cursor.execute('''
+        CREATE VIRTUAL TABLE places_fts_prefix USING fts5(
+            dutyName, dutyAddr, content='places', content_rowid='rowid', prefix='1 2'
+        )
+    ''')
+    cursor.execute("INSERT INTO places_fts(places_fts) VALUES ('rebuild')")
+    cursor.execute("INSERT INTO places_fts_prefix(places_fts_prefix) VALUES ('rebuild')")
+    conn.commit()
+    conn.close()
+    print("Search index built.")
+
+def build_region_aggregates(db_file=None):
+    """
+    Materializes per-region counts for dashboards and db_viewer:
+      region_totals (sido, sigungu, type, total)
+      region_open_counts (sido, sigungu, type, slot, open_count)
+    A place counts as open in a slot if it is open at the slot's first minute.
+    Slots use the open-index layout (utils.time_slot); only non-zero counts are
+    stored, so a (region, slot) missing from region_open_counts has none open.
+    """
+    conn = sqlite3.connect(db_file or DB_FILE)
+    place_ids, starts, ends = load_schedule_arrays(conn)
+    info = {rowid: (addr, type_) for rowid, addr, type_ in conn.execute("SELECT rowid, dutyAddr, type FROM places")}
+
+    # Region key per place -> integer code for bincount
+    region_keys = []
+    region_codes = {}
+    place_codes = np.full(len(place_ids), -1, dtype=np.int64)
+    for idx, place_id in enumerate(place_ids):
+        addr, type_ = info[int(place_id)]
+        sido, sigungu = split_region(addr)
+        if sido is None:
+            continue
+        key = (sido, sigungu or "", type_)
+        if key not in region_codes:
+            region_codes[key] = len(region_keys)
+            region_keys.append(key)
+        place_codes[idx] = region_codes[key]
+
+    known = place_codes >= 0
+    totals = np.bincount(place_codes[known], minlength=len(region_keys))
+
+    open_rows = []
+    for slot in range(NUM_SLOTS):
+        day = slot // SLOTS_PER_DAY
+        minute = (slot % SLOTS_PER_DAY) * SLOT_MINUTES
+        s_col = starts[:, day]
+        e_col = ends[:, day]
+        is_open = known & (s_col >= 0) & (e_col >= 0) & (s_col <= minute) & (minute <= e_col)
+        counts = np.bincount(place_codes[is_open], minlength=len(region_keys))
+        for code in np.flatnonzero(counts):
+            open_rows.append(region_keys[code] + (slot, int(counts[code])))
+
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS region_totals (
+            sido TEXT, sigungu TEXT, type TEXT, total INTEGER,
+            PRIMARY KEY (sido, sigungu, type)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS region_open_counts (
+            sido TEXT, sigungu TEXT, type TEXT, slot INTEGER, open_count INTEGER,
+            PRIMARY KEY (slot, sido, sigungu, type)
+        )
+    ''')
+    cursor.execute("DELETE FROM region_totals")
+    cursor.execute("DELETE FROM region_open_counts")
+    cursor.executemany(
+        "INSERT INTO region_totals VALUES (?, ?, ?, ?)",
+        [key + (int(total),) for key, total in zip(region_keys, totals)]
+    )
+    cursor.executemany("INSERT INTO region_open_counts VALUES (?, ?, ?, ?, ?)", open_rows)
+    conn.commit()
+    conn.close()
+    print(f"Region aggregates built ({len(region_keys)} region/type groups).")
+
+def build_unit_vectors(db_file=None):
+    """
+    Fills x, y, z for rows that lack them (older DBs, rows loaded by other
+    tools). fetch_and_save() already stores them for new rows.
+    """
+    conn = sqlite3.connect(db_file or DB_FILE)
+    cursor = conn.cursor()
+    _ensure_unit_vector_columns(cursor)
+    rows = cursor.execute(
+        "SELECT rowid, wgs84Lat, wgs84Lon FROM places WHERE x IS NULL AND wgs84Lat IS NOT NULL AND wgs84Lon IS NOT NULL"
+    ).fetchall()
+    if rows:
+        ids = np.array([row[0] for row in rows])
+        lat = np.radians(np.array([row[1] for row in rows], dtype=np.float64))
+        lon = np.radians(np.array([row[2] for row in rows], dtype=np.float64))
+        cursor.executemany(
+            "UPDATE places SET x = ?, y = ?, z = ? WHERE rowid = ?",
+            zip((np.cos(lat) * np.cos(lon)).tolist(), (np.cos(lat) * np.sin(lon)).tolist(),
+                np.sin(lat).tolist(), ids.tolist())
+        )
+    conn.commit()
+    conn.close()
+    print(f"Unit vectors filled for {len(rows)} places.")
+
+def build_schedules(db_file=None):
+    """
+    Interns the distinct dutyTime schedules into the schedules table and fills
+    places.schedule_id where it is missing (older DBs, rows loaded by other
+    tools; fetch_and_save() already stores it for new rows).
+    """
+    conn = sqlite3.connect(db_file or DB_FILE)
+    cursor = conn.cursor()
+    _ensure_schedule_column(cursor)
+    # Distinct weekly schedules; the loader evaluates each once per request
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schedules (
+            schedule_id INTEGER PRIMARY KEY,
+            dutyTime1s TEXT, dutyTime1c TEXT,
+            dutyTime2s TEXT, dutyTime2c TEXT,
+            dutyTime3s TEXT, dutyTime3c TEXT,
+            dutyTime4s TEXT, dutyTime4c TEXT,
+            dutyTime5s TEXT, dutyTime5c TEXT,
+            dutyTime6s TEXT, dutyTime6c TEXT,
+            dutyTime7s TEXT, dutyTime7c TEXT,
+            dutyTime8s TEXT, dutyTime8c TEXT,
+            places INTEGER
+        )
+    ''')
+    columns = []
+    for i in range(1, 9):
+        columns += [f"dutyTime{i}s", f"dutyTime{i}c"]
+
+    rows = cursor.execute(f"SELECT rowid, {', '.join(columns)} FROM places WHERE schedule_id IS NULL").fetchall()
+    cursor.executemany(
+        "UPDATE places SET schedule_id = ? WHERE rowid = ?",
+        [(schedule_id(row[1:]), row[0]) for row in rows]
+    )
+
+    # Rebuilt from scratch so schedules no place uses any more disappear
+    cursor.execute("DELETE FROM schedules")
+    cursor.execute(f'''
+        INSERT INTO schedules (schedule_id, {', '.join(columns)}, places)
+        SELECT schedule_id, {', '.join(f"MIN({column})" for column in columns)}, COUNT(*)
+        FROM places GROUP BY schedule_id
+    ''')
+    distinct = cursor.execute("SELECT COUNT(*) FROM schedules").fetchone()[0]
+    conn.commit()
+    conn.close()
+    print(f"Schedules built ({distinct} distinct, {len(rows)} places filled).")
+
+def rebuild_derived(db_file=None, index_file=None):
+    """Rebuilds every index/table derived from places."""
+    build_unit_vectors(db_file)
+    build_schedules(db_file)
+    build_open_index(db_file, index_file)
+    build_transitions(db_file)
+    build_search_index(db_file)
+    build_region_aggregates(db_file)
+
+def set_dataset_meta(key, value, db_file=None):
+    """Records dataset-level metadata (version, refresh time) in dataset_meta."""
+    conn = sqlite3.connect(db_file or DB_FILE)
+    conn.execute("CREATE TABLE IF NOT EXISTS dataset_meta (key TEXT PRIMARY KEY, value TEXT)")
+    conn.execute("INSERT OR REPLACE INTO dataset_meta (key, value) VALUES (?, ?)", (key, str(value)))
+    conn.commit()
+    conn.close()
+
+# --- Sharded layout ---
+
+def shard_path(sido):
+    return os.path.join(SHARD_DIR, f"{sido}.db")
+
+def shard_index_path(sido):
+    return os.path.join(SHARD_DIR, f"{sido}.open_index.db")
 
-    print(f"--- {type_label} Collection Complete. Total Saved: {total_saved} ---")
+def refresh_shard(sido):
+    """
+    Collects one province into its own shard and rebuilds its derived indexes.
+    Shards are separate files, so provinces refresh in parallel without
+    contending on a single database.
+    """
+    db_file = shard_path(sido)
+    init_db(db_file)
+    failed = collect_units(region_units([sido]), db_file)
+    rebuild_derived(db_file, shard_index_path(sido))
+    if failed:
+        raise RuntimeError(f"{len(failed)} unit(s) incomplete, rerun to resume")
+    set_dataset_meta("updated_at", time.strftime("%Y-%m-%d %H:%M:%S"), db_file)
+
+def write_shard_index():
+    """
+    Writes SHARD_DIR/shards.json: per sido, its DB and open index files and the
+    bounding box of its coordinates, used by data_loader to route queries.
+    """
+    shards = {}
+    for sido in KOREA_ADMIN_DIVISIONS:
+        db_file = shard_path(sido)
+        if not os.path.exists(db_file):
+            continue
+        conn = sqlite3.connect(db_file)
+        min_lat, max_lat, min_lon, max_lon, rows = conn.execute(
+            "SELECT MIN(wgs84Lat), MAX(wgs84Lat), MIN(wgs84Lon), MAX(wgs84Lon), COUNT(*) FROM places"
+        ).fetchone()
+        conn.close()
+        shards[sido] = {
+            "file": os.path.basename(db_file),
+            "open_index": os.path.basename(shard_index_path(sido)),
+            "bbox": [min_lat, max_lat, min_lon, max_lon] if rows and min_lat is not None else None,
+            "rows": rows,
+        }
+
+    tmp_file = os.path.join(SHARD_DIR, SHARD_INDEX + ".tmp")
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(shards, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_file, os.path.join(SHARD_DIR, SHARD_INDEX))
+    print(f"Shard index written ({len(shards)} shards).")
+
+def collect_sharded(sidos=None, max_workers=SHARD_WORKERS):
+    """
+    Refreshes the given provinces (default: all) in parallel, then the shard index.
+    Returns the sidos whose shard is incomplete (rerun to resume them).
+    """
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    sidos = list(sidos or KOREA_ADMIN_DIVISIONS)
+    failed = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for sido, future in [(sido, pool.submit(refresh_shard, sido)) for sido in sidos]:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Error refreshing shard {sido}: {e}")
+                failed.append(sido)
+    write_shard_index()
+    return failed
 
 if __name__ == "__main__":
+    if SHARD_DIR:
+        # Snapshots/deltas cover a single hospital.db; replicas can't sync shards yet
+        if SNAPSHOT_DIR:
+            print("SNAPSHOT_DIR은 SHARD_DIR과 함께 사용할 수 없습니다.")
+            sys.exit(2)
+        # Sharded layout: python collector.py [sido ...] refreshes only those provinces
+        failed = collect_sharded(sys.argv[1:] or None)
+        if failed:
+            print(f"{len(failed)}개 지역 샤드 수집이 실패했습니다 ({', '.join(failed)}). 다시 실행하면 이어서 수집합니다.")
+            sys.exit(1)
+        print("모든 데이터 수집이 완료되었습니다.")
+        sys.exit(0)
+
     init_db()
     
-    # Collect Pharmacies
-    fetch_and_save(PHARMACY_URL, "약국")
-    
-    # Collect Hospitals
-    fetch_and_save(HOSPITAL_URL, "병원")
+    # Collect Pharmacies and Hospitals, one work unit per province
+    failed = collect_units(region_units())
+
+    # Rebuild derived indexes
+    rebuild_derived()
+    if failed:
+        print(f"{len(failed)}개 수집 단위가 실패했습니다. 다시 실행하면 중단된 페이지부터 이어서 수집합니다.")
+        sys.exit(1)
+    set_dataset_meta("updated_at", time.strftime("%Y-%m-%d %H:%M:%S"))
+
+    # Publish a versioned snapshot + delta for app replicas
+    if SNAPSHOT_DIR:
+        from snapshot import publish_snapshot
+        publish_snapshot(DB_FILE, SNAPSHOT_DIR)
     
     print("모든 데이터 수집이 완료되었습니다.")
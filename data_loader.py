@@ -1,11 +1,103 @@
 import requests
 import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 
 load_dotenv()
 
 API_KEY = os.getenv("DATA_GO_KR_API_KEY")
 
+# Live API client: pooled connections, a latency budget per call and a circuit breaker
+API_LATENCY_BUDGET = 5 # seconds a live call may take before we fall back to the DB
+API_CONNECT_TIMEOUT = 3
+API_POOL_SIZE = 8
+BREAKER_FAILURES = 3 # consecutive failures that open the circuit
+BREAKER_RESET = 60 # seconds before a trial call is let through
+
+class CircuitOpenError(Exception):
+    pass
+
+class CircuitBreaker:
+    """
+    Stops calling a failing API for a while. After `failures` consecutive
+    failures the circuit opens and calls are refused; after `reset_timeout`
+    seconds one trial call goes through (half-open) and closes it on success.
+    """
+    def __init__(self, failures=BREAKER_FAILURES, reset_timeout=BREAKER_RESET):
+        self.max_failures = failures
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if not self._trial and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.max_failures:
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            return "half-open" if self._trial else "open"
+
+API_BREAKER = CircuitBreaker()
+
+_session = requests.Session()
+_session.mount("http://", HTTPAdapter(pool_connections=API_POOL_SIZE, pool_maxsize=API_POOL_SIZE))
+_session.mount("https://", HTTPAdapter(pool_connections=API_POOL_SIZE, pool_maxsize=API_POOL_SIZE))
+_api_pool = ThreadPoolExecutor(max_workers=API_POOL_SIZE, thread_name_prefix="api")
+
+def api_get(url, params, budget=API_LATENCY_BUDGET):
+    """
+    GET through the pooled session, giving up after `budget` seconds in total.
+    Raises CircuitOpenError while the breaker is open, TimeoutError when the
+    budget runs out, or the requests error. Timeouts, connection errors and
+    5xx responses count toward opening the breaker.
+    """
+    if not API_BREAKER.allow():
+        raise CircuitOpenError("data.go.kr circuit is open")
+
+    # requests' timeout is per socket operation, so the overall budget is
+    # enforced on the future; the read timeout bounds the worker thread too
+    future = _api_pool.submit(_session.get, url, params=params, timeout=(API_CONNECT_TIMEOUT, budget))
+    try:
+        response = future.result(timeout=budget)
+    except FutureTimeout:
+        API_BREAKER.record_failure()
+        raise TimeoutError(f"no response within {budget}s")
+    except Exception:
+        API_BREAKER.record_failure()
+        raise
+
+    if response.status_code >= 500:
+        API_BREAKER.record_failure()
+        response.raise_for_status()
+    API_BREAKER.record_success()
+    return response
+
 def get_pharmacy_list(Q0, Q1, ord="NAME", pageNo=1, numOfRows=10):
     """
     국립중앙의료원_전국 약국 정보 조회 서비스
@@ -33,7 +125,7 @@ def get_pharmacy_list(Q0, Q1, ord="NAME", pageNo=1, numOfRows=10):
     # Usually keys starting with long alphanumeric strings are decoded. %2B... are encoded.
     # The provided key: b081... seems decoded (hex).
     
-    response = requests.get(url, params=params)
+    response = api_get(url, params)
     # print(f"Request URL: {response.url}") # Debug URL
     return response
 
@@ -59,7 +151,7 @@ def get_pharmacy_list_v2(Q0, Q1, pageNo=1, numOfRows=10):
         "numOfRows": numOfRows,
         "_type": "json"
     }
-    response = requests.get(url, params=params)
+    response = api_get(url, params)
     print(f"Request URL V2: {response.url}")
     return response
 
@@ -77,7 +169,7 @@ def get_hospital_list(Q0, Q1, ord="NAME", pageNo=1, numOfRows=10):
         "numOfRows": numOfRows,
         "_type": "json"
     }
-    response = requests.get(url, params=params)
+    response = api_get(url, params)
     print(f"Request URL Hospital: {response.url}")
     return response
 
@@ -205,14 +297,304 @@ def get_real_hospital_list(Q0, Q1):
         elif items is None:
             items = []
             
+        return items
     except Exception as e:
         print(f"Error fetching real hospital data: {e}")
         return []
 
 import sqlite3
 import math
+import zlib
+import json
+import heapq
+import copy
+from itertools import islice
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import numpy as np
+from utils import (
+    schedule_day_index, is_open_now, format_operating_hours, time_slot, split_region,
+    unit_vector, schedule_id, SIDO_ALIASES, KOREA_ADMIN_DIVISIONS, DAY_END_MINUTE
+)
+from profiling import profile_hook
 
 DB_FILE = "hospital.db"
+OPEN_INDEX_FILE = "open_index.db" # Built by collector.build_open_index()
+INDEX_VERSION_KEY = "open_index_version" # collector.INDEX_VERSION_KEY
+
+# Sharded layout (collector.collect_sharded): one DB per sido in SHARD_DIR,
+# routed through the bounding boxes in shards.json
+SHARD_DIR = os.getenv("SHARD_DIR")
+SHARD_INDEX = "shards.json"
+EARTH_RADIUS_KM = 6371
+BATCH_BLOCK_SIZE = 256 # Origins per vectorized distance block
+
+# Process-wide result cache shared by all sessions
+RESULT_CACHE_SIZE = 256
+RESULT_CACHE_MAX_ROWS = 50000 # Place records across all entries (~1.2 KB each)
+RESULT_CACHE_TTL = 300 # seconds
+FALLBACK_CACHE_TTL = 30 # DB fallbacks for a failed live call: retry the API soon
+
+# Speculative prefetch of the queries a user is likely to run next
+PREFETCH_ENABLED = os.getenv("PREFETCH", "1") != "0"
+PREFETCH_WORKERS = 2
+PREFETCH_MAX_PENDING = 32 # queued prefetches across all sessions
+PREFETCH_TILE_DEG = 0.01 # radius-mode tiles (~1km)
+PREFETCH_TILE_MAX_KM = 10 # larger radii are not prefetched per tile
+TILE_PLACES_LIMIT = 5000 # a tile with more candidates is not used (or kept)
+OTHER_TYPE = {"약국": "병원", "병원": "약국"}
+
+# Formatted opening hours per schedule id (few distinct schedules, so this rarely fills)
+FORMATTED_HOURS_SIZE = 4096
+_FORMATTED_HOURS = {}
+
+# Full-text search: terms shorter than this use the prefix index instead of trigrams
+TRIGRAM_MIN_LENGTH = 3
+
+# Expanding-ring search: start small, widen geometrically
+RING_START_KM = 1
+RING_GROWTH = 2
+RING_MAX_KM = 500
+
+# Hot reload: how often the watcher checks for a new dataset version
+DATASET_POLL_SECONDS = int(os.getenv("DATASET_POLL_SECONDS", "30"))
+
+def _read_shard_index():
+    """Returns the shard index {sido: {"file", "open_index", "bbox", "rows"}}."""
+    try:
+        with open(os.path.join(SHARD_DIR, SHARD_INDEX), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _boxes_intersect(a, b):
+    """True if two (min_lat, max_lat, min_lon, max_lon) boxes overlap."""
+    return a[0] <= b[1] and b[0] <= a[1] and a[2] <= b[3] and b[2] <= a[3]
+
+def _target_files(shards, bbox=None, sido=None):
+    """
+    Returns the (db_file, open_index_file) pairs a query has to touch.
+    Without SHARD_DIR that is always the single DB_FILE. With shards:
+    only the shard of `sido` when given, else the shards whose bounding box
+    intersects `bbox` (min_lat, max_lat, min_lon, max_lon), else all shards.
+    """
+    if not SHARD_DIR:
+        return [(DB_FILE, OPEN_INDEX_FILE)]
+    if sido is not None:
+        entries = [shards[sido]] if sido in shards else []
+    else:
+        entries = [
+            entry for entry in shards.values()
+            if entry["bbox"] and (bbox is None or _boxes_intersect(bbox, entry["bbox"]))
+        ]
+    return [(os.path.join(SHARD_DIR, entry["file"]), os.path.join(SHARD_DIR, entry["open_index"]))
+            for entry in entries]
+
+def _dataset_version(shards):
+    """
+    Cheap fingerprint of the data on disk: per DB, the refresh markers the
+    collector / snapshot sync write last (dataset_meta updated_at and
+    snapshot_version) and the open index mtime, plus the shard index.
+    """
+    version = []
+    if SHARD_DIR:
+        path = os.path.join(SHARD_DIR, SHARD_INDEX)
+        version.append(os.path.getmtime(path) if os.path.exists(path) else None)
+    for db_file, index_file in _target_files(shards):
+        meta = ()
+        if os.path.exists(db_file):
+            try:
+                conn = sqlite3.connect(db_file)
+                meta = tuple(conn.execute(
+                    "SELECT key, value FROM dataset_meta WHERE key IN ('updated_at', 'snapshot_version') ORDER BY key"
+                ).fetchall())
+                conn.close()
+            except sqlite3.Error:
+                pass
+        index_mtime = os.path.getmtime(index_file) if os.path.exists(index_file) else None
+        version.append((db_file, meta, index_mtime))
+    return tuple(version)
+
+class Dataset:
+    """
+    One loaded version of the data: the DB/shard files to query and their
+    open indexes (compressed slot bitsets held in memory, decompressed on
+    first use). Queries take the current Dataset once and keep using it, so a
+    reload doesn't change the shard map or open indexes under a running query.
+    The DB files are read live; an index is only applied to rows read from
+    the DB it was built from (see index_matches).
+    """
+    _generations = 0
+
+    def __init__(self, shards, version):
+        Dataset._generations += 1
+        self.generation = Dataset._generations # part of every result cache key
+        self.shards = shards
+        self.version = version
+        self.loaded_at = datetime.now()
+        self._indexes = {} # index_file -> {"size", "blobs", "slots"}
+        self._columns = {} # db_file -> places column names
+        self._vectors = {} # db_file -> every located row has x, y, z
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls):
+        """Reads the shard index and every open index into a new Dataset."""
+        shards = _read_shard_index() if SHARD_DIR else {}
+        dataset = cls(shards, _dataset_version(shards))
+        for _, index_file in dataset.targets():
+            dataset._indexes[index_file] = _read_open_index(index_file)
+        return dataset
+
+    def targets(self, bbox=None, sido=None):
+        return _target_files(self.shards, bbox, sido)
+
+    def _place_columns(self, db_file):
+        """Column names of db_file's places table (read once per version)."""
+        if db_file not in self._columns:
+            try:
+                conn = sqlite3.connect(db_file)
+                columns = {row[1] for row in conn.execute("PRAGMA table_info(places)")}
+                conn.close()
+            except sqlite3.Error:
+                columns = set()
+            self._columns[db_file] = columns
+        return self._columns[db_file]
+
+    def has_unit_vectors(self, db_file):
+        """
+        True if db_file's places table has the x, y, z columns and they are
+        filled for every row with coordinates (checked once per version). A DB
+        migrated by init_db but not yet rebuilt, or synced from an older
+        publisher, has NULL vectors, which the SQL ranking would drop.
+        """
+        if db_file not in self._vectors:
+            populated = False
+            if {"x", "y", "z"} <= self._place_columns(db_file):
+                try:
+                    conn = sqlite3.connect(db_file)
+                    populated = not conn.execute(
+                        "SELECT EXISTS (SELECT 1 FROM places WHERE x IS NULL "
+                        "AND wgs84Lat IS NOT NULL AND wgs84Lon IS NOT NULL)"
+                    ).fetchone()[0]
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._vectors[db_file] = populated
+        return self._vectors[db_file]
+
+    def has_schedule_ids(self, db_file):
+        """True if db_file's places table has the schedule_id column."""
+        return "schedule_id" in self._place_columns(db_file)
+
+    def open_slot(self, slot, index_file=None):
+        """
+        Returns (full, partial, size) for a time slot: packed little-endian
+        bitsets of places.rowid and the number of ids covered.
+        Returns None if the index has not been built.
+        """
+        index = self._indexes.get(index_file or OPEN_INDEX_FILE)
+        if index is None or slot not in index["blobs"]:
+            return None
+        if slot not in index["slots"]:
+            with self._lock:
+                index["slots"][slot] = tuple(
+                    np.frombuffer(zlib.decompress(blob), dtype=np.uint8) for blob in index["blobs"][slot]
+                )
+        full, partial = index["slots"][slot]
+        return full, partial, index["size"]
+
+    def index_matches(self, index_file, db_version):
+        """
+        True if index_file's bitsets describe the rowids of a DB whose
+        INDEX_VERSION_KEY is db_version (read with its rows). A DB replaced by
+        a snapshot sync or rewritten since the index was loaded doesn't match.
+        """
+        index = self._indexes.get(index_file or OPEN_INDEX_FILE)
+        return index is not None and db_version is not None and index["db_version"] == db_version
+
+def _index_version(conn):
+    """The DB's INDEX_VERSION_KEY (None if never stamped or since rewritten)."""
+    try:
+        row = conn.execute("SELECT value FROM dataset_meta WHERE key = ?", (INDEX_VERSION_KEY,)).fetchone()
+    except sqlite3.Error:
+        return None
+    return row[0] if row else None
+
+def _read_open_index(index_file):
+    """Loads an open index file's compressed slots, or None if it is missing."""
+    if not os.path.exists(index_file):
+        return None
+    try:
+        conn = sqlite3.connect(index_file)
+        meta = dict(conn.execute("SELECT key, value FROM open_index_meta"))
+        blobs = {slot: (full, partial) for slot, full, partial in
+                 conn.execute("SELECT slot, full_bits, partial_bits FROM open_slots")}
+        conn.close()
+    except sqlite3.Error as e:
+        print(f"Error loading open index {index_file}: {e}")
+        return None
+    size = int(meta["max_place_id"]) + 1 if "max_place_id" in meta else 0
+    return {"size": size, "blobs": blobs, "slots": {}, "db_version": meta.get("db_version")}
+
+_dataset = None
+_dataset_lock = threading.Lock()
+
+def current_dataset():
+    """The Dataset queries should use (loaded on first call)."""
+    global _dataset
+    if _dataset is None:
+        with _dataset_lock:
+            if _dataset is None:
+                _dataset = Dataset.load()
+    return _dataset
+
+def reload_dataset(force=False):
+    """
+    Loads a new Dataset if the version on disk changed and swaps it in.
+    The swap is a single reference assignment; results cached for the old
+    version are dropped (their keys carry the old generation anyway).
+    Returns True if a new version was installed.
+    """
+    global _dataset
+    with _dataset_lock:
+        old = _dataset
+        if old is not None and not force:
+            shards = _read_shard_index() if SHARD_DIR else {}
+            if _dataset_version(shards) == old.version:
+                return False
+        new = Dataset.load()
+        _dataset = new
+    RESULT_CACHE.clear()
+    print(f"Dataset reloaded (generation {new.generation}).")
+    return True
+
+_watcher = None
+
+def start_dataset_watcher(interval=DATASET_POLL_SECONDS):
+    """
+    Starts a daemon thread that polls for a new dataset version every
+    `interval` seconds and hot-swaps it (once per process; 0 disables).
+    """
+    global _watcher
+    if _watcher is not None or interval <= 0:
+        return _watcher
+
+    def watch():
+        while True:
+            time.sleep(interval)
+            try:
+                reload_dataset()
+            except Exception as e:
+                print(f"Error reloading dataset: {e}")
+
+    _watcher = threading.Thread(target=watch, name="dataset-watcher", daemon=True)
+    _watcher.start()
+    return _watcher
+
+def _db_targets(bbox=None, sido=None):
+    """(db_file, open_index_file) pairs of the current dataset; see _target_files."""
+    return current_dataset().targets(bbox, sido)
 
 def haversine(lat1, lon1, lat2, lon2):
     """
@@ -230,61 +612,1261 @@ def haversine(lat1, lon1, lat2, lon2):
     r = 6371 # Radius of earth in kilometers. Use 3956 for miles
     return c * r
 
-def get_nearby_places(lat, lon, radius_km, place_type="약국", limit=1000):
+# Fields the UI reads under the API's key names (see Place.get)
+_PLACE_ALIASES = {
+    "dutyName": "name", "yadmNm": "name",
+    "dutyAddr": "address", "addr": "address",
+    "dutyTel1": "tel", "telno": "tel",
+    "wgs84Lat": "lat", "YPos": "lat",
+    "wgs84Lon": "lon", "XPos": "lon",
+}
+ALL_DAYS_MASK = 0xFF # dutyTime1..8 loaded
+HOURS_BATCH_SIZE = 500 # hpids per query when bulk-loading a day's hours
+
+class HoursNotLoaded(LookupError):
+    """A Place's dutyTime of a day that its query didn't load was read."""
+
+class Place:
     """
-    Fetches places within radius_km from the local DB.
-    Optimized with a bounding box query first.
+    Compact record for one facility, shared by the loader and the UI.
+
+    List queries only fetch the columns the list view needs plus the
+    dutyTime columns of the queried day and Sunday; load_place_hours()
+    fetches the full schedule when the detail view opens, with_day_hours()
+    another day for a whole list. get() and [] accept the API key names
+    ("dutyName", "wgs84Lat", "dutyTime1s", ...) so the utils helpers work on
+    it unchanged; reading hours that are not loaded raises HoursNotLoaded.
+    """
+    __slots__ = ("place_id", "hpid", "name", "address", "tel", "lat", "lon", "type",
+                 "schedule_id", "distance", "hours", "hours_mask", "is_open", "status_msg",
+                 "opens_at", "closes_at")
+
+    def __init__(self, place_id=None, hpid=None, name=None, address=None, tel=None,
+                 lat=None, lon=None, type=None, schedule_id=None, distance=None):
+        self.place_id = place_id
+        self.hpid = hpid
+        self.name = name
+        self.address = address
+        self.tel = tel
+        self.lat = lat
+        self.lon = lon
+        self.type = type
+        self.schedule_id = schedule_id # places.schedule_id: places sharing it share all hours
+        self.distance = distance
+        self.hours = [None] * 16 # dutyTime{d}s at (d-1)*2, dutyTime{d}c at (d-1)*2+1
+        self.hours_mask = 0 # bit d-1 set when dutyTime{d} is loaded
+        self.is_open = None
+        self.status_msg = None
+        self.opens_at = None
+        self.closes_at = None
+
+    @classmethod
+    def from_api_item(cls, item):
+        """Builds a Place from a live API item. Returns None without coordinates."""
+        place = cls(
+            hpid=item.get("hpid"),
+            name=item.get("dutyName") or item.get("yadmNm"),
+            address=item.get("dutyAddr") or item.get("addr"),
+            tel=item.get("dutyTel1") or item.get("telno"),
+        )
+        try:
+            place.lat = float(item.get("wgs84Lat") or item.get("YPos"))
+            place.lon = float(item.get("wgs84Lon") or item.get("XPos"))
+        except (TypeError, ValueError):
+            return None
+        for i in range(1, 9):
+            place.hours[(i - 1) * 2] = item.get(f"dutyTime{i}s")
+            place.hours[(i - 1) * 2 + 1] = item.get(f"dutyTime{i}c")
+        place.hours_mask = ALL_DAYS_MASK
+        place.schedule_id = schedule_id(place.hours)
+        return place
+
+    @property
+    def is_sunday(self):
+        """Open on Sundays (dutyTime7s/c present)."""
+        return bool(self.get("dutyTime7s") and self.get("dutyTime7c"))
+
+    def get(self, key, default=None):
+        if key.startswith("dutyTime"):
+            day = int(key[8:-1])
+            if not (self.hours_mask >> (day - 1)) & 1:
+                raise HoursNotLoaded(f"dutyTime{day} of {self.hpid} is not loaded")
+            value = self.hours[(day - 1) * 2 + (key[-1] == "c")]
+        else:
+            value = getattr(self, _PLACE_ALIASES.get(key, key), None)
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        return self.get(key)
+
+    def __repr__(self):
+        return f"Place({self.hpid!r}, {self.name!r})"
+
+def _list_columns(days, prefix="", schedule_ids=False):
+    """
+    SELECT list for list-view queries: identity/location, schedule id and
+    dutyTime columns of `days`. schedule_ids: the DB has places.schedule_id
+    (see Dataset.has_schedule_ids); without it the id is NULL.
+    """
+    columns = ["rowid", "hpid", "dutyName", "dutyAddr", "dutyTel1", "wgs84Lat", "wgs84Lon", "type"]
+    columns = [prefix + column for column in columns]
+    columns.append(prefix + "schedule_id" if schedule_ids else "NULL")
+    for day in days:
+        columns += [f"{prefix}dutyTime{day}s", f"{prefix}dutyTime{day}c"]
+    return columns
+
+def _list_days(current_datetime=None):
+    """dutyTime days a list query loads: the day being evaluated and Sunday (for the badge)."""
+    if current_datetime is None:
+        current_datetime = datetime.now()
+    return sorted({schedule_day_index(current_datetime), 7})
+
+def _place_from_row(row, days):
+    place = Place(*row[:9])
+    for n, day in enumerate(days):
+        place.hours[(day - 1) * 2] = row[9 + n * 2]
+        place.hours[(day - 1) * 2 + 1] = row[10 + n * 2]
+        place.hours_mask |= 1 << (day - 1)
+    return place
+
+def load_place_hours(place):
+    """
+    Fills in the full dutyTime1..8 schedule of a Place (lazily, for the detail view).
+    Returns the place.
+    """
+    if place.hours_mask == ALL_DAYS_MASK:
+        return place
+    try:
+        columns = []
+        for i in range(1, 9):
+            columns += [f"dutyTime{i}s", f"dutyTime{i}c"]
+        # The address names the shard; fall back to every shard if it doesn't
+        sido = split_region(place.address)[0] if SHARD_DIR else None
+        targets = _db_targets(sido=sido) if sido else []
+        for db_file, _ in targets + [t for t in _db_targets() if t not in targets]:
+            conn = sqlite3.connect(db_file)
+            row = conn.execute(f"SELECT {', '.join(columns)} FROM places WHERE hpid = ?", (place.hpid,)).fetchone()
+            conn.close()
+            if row:
+                place.hours = list(row)
+                break
+    except Exception as e:
+        print(f"Error loading operating hours: {e}")
+    place.hours_mask = ALL_DAYS_MASK
+    return place
+
+def with_day_hours(places, current_datetime=None):
+    """
+    The places with the dutyTime of current_datetime's day (default: now)
+    loaded, e.g. for a list fetched just before midnight. Places missing it
+    are replaced by copies (the originals may be shared through the result
+    cache), filled with one query per DB file. Returns a new list.
+    """
+    day = schedule_day_index(current_datetime or datetime.now())
+    bit = 1 << (day - 1)
+    missing = {place.hpid: None for place in places if not place.hours_mask & bit}
+    if not missing:
+        return list(places)
+
+    try:
+        hpids = list(missing)
+        for db_file, _ in _db_targets():
+            conn = sqlite3.connect(db_file)
+            for i in range(0, len(hpids), HOURS_BATCH_SIZE):
+                batch = hpids[i:i + HOURS_BATCH_SIZE]
+                for hpid, start, close in conn.execute(
+                    f"SELECT hpid, dutyTime{day}s, dutyTime{day}c FROM places "
+                    f"WHERE hpid IN ({', '.join('?' * len(batch))})", batch
+                ):
+                    missing[hpid] = (start, close)
+            conn.close()
+    except Exception as e:
+        print(f"Error loading operating hours: {e}")
+
+    results = []
+    for place in places:
+        if not place.hours_mask & bit:
+            place = copy.copy(place)
+            place.hours = list(place.hours)
+            place.hours[(day - 1) * 2:day * 2] = missing[place.hpid] or (None, None)
+            place.hours_mask |= bit
+        results.append(place)
+    return results
+
+def _schedule_status(place, current_datetime, statuses):
+    """is_open_now() for a place, evaluated once per schedule id in `statuses`."""
+    key = getattr(place, "schedule_id", None)
+    if key is None:
+        return is_open_now(place, current_datetime)
+    status = statuses.get(key)
+    if status is None:
+        status = statuses[key] = is_open_now(place, current_datetime)
+    return status
+
+def open_statuses(places, current_datetime=None):
+    """
+    is_open_now() status of each place for current_datetime (default: now),
+    without modifying the places. Computed once per distinct schedule.
+    """
+    if current_datetime is None:
+        current_datetime = datetime.now()
+    statuses = {}
+    return [_schedule_status(place, current_datetime, statuses) for place in places]
+
+def annotate_open_status(places, current_datetime=None):
+    """
+    Sets is_open / status_msg on each Place for current_datetime (default: now).
+    The status is computed once per distinct schedule and shared.
+    """
+    for place, status in zip(places, open_statuses(places, current_datetime)):
+        place.is_open = status["is_open"]
+        place.status_msg = status["message"]
+    return places
+
+def place_operating_hours(place):
+    """
+    format_operating_hours() for a place, cached per schedule id (ids are
+    content hashes, so the cache stays valid across dataset reloads).
+    """
+    key = place.schedule_id
+    if key is None:
+        return format_operating_hours(place)
+    hours = _FORMATTED_HOURS.get(key)
+    if hours is None:
+        if len(_FORMATTED_HOURS) >= FORMATTED_HOURS_SIZE:
+            _FORMATTED_HOURS.clear()
+        hours = _FORMATTED_HOURS[key] = format_operating_hours(place)
+    return hours
+
+def fetch_live_items(Q0, Q1, place_type="약국"):
+    """
+    Live API items for a district (unlike get_real_*_list, raises on failure
+    so callers can tell an outage from an empty district).
+    """
+    fetch = get_pharmacy_list if place_type == "약국" else get_hospital_list
+    response = fetch(Q0, Q1, numOfRows=500)
+    if response.status_code != 200:
+        raise requests.HTTPError(f"HTTP {response.status_code}")
+    items = response.json().get('response', {}).get('body', {}).get('items')
+    # An empty result comes back as items: ""
+    items = items.get('item') if isinstance(items, dict) else None
+    if isinstance(items, dict):
+        items = [items]
+    return items or []
+
+class RegionPlaces(list):
+    """
+    Place records plus where they came from: source is "live" (API) or
+    "fallback" (collected DB); updated_at is when that data was fetched.
+    """
+    def __init__(self, places, source, updated_at=None):
+        super().__init__(places)
+        self.source = source
+        self.updated_at = updated_at
+
+def get_dataset_updated_at(sido=None):
+    """Last collection time of the local DB (or sido's shard), or None."""
+    try:
+        for db_file, _ in _db_targets(sido=sido if SHARD_DIR else None):
+            conn = sqlite3.connect(db_file)
+            row = conn.execute("SELECT value FROM dataset_meta WHERE key = 'updated_at'").fetchone()
+            conn.close()
+            if row:
+                return row[0]
+    except sqlite3.Error:
+        pass
+    return None
+
+def get_live_region_places(city, district, place_type="약국"):
+    """
+    Fetches a district's places from the live API as Place records.
+    Falls back to the collected places table for the same district when the
+    API is slow (over API_LATENCY_BUDGET), failing, or its circuit is open.
+    Returns a RegionPlaces list marked "live" or "fallback".
+    """
+    try:
+        items = fetch_live_items(city, district, place_type)
+        places = (Place.from_api_item(item) for item in items)
+        return RegionPlaces([place for place in places if place is not None], "live",
+                            datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    except Exception as e:
+        print(f"Live API unavailable, using local DB: {e}")
+    return RegionPlaces(get_region_places(city, district, place_type), "fallback",
+                        get_dataset_updated_at(city))
+
+def _address_patterns(sido, sigungu=None):
+    """dutyAddr LIKE patterns for a region; addresses may still use the old province names."""
+    sido = SIDO_ALIASES.get(sido, sido)
+    names = [sido] + [alias for alias, name in SIDO_ALIASES.items() if name == sido]
+    if sigungu and sigungu != sido:
+        return [f"{name} {sigungu}%" for name in names]
+    return [f"{name}%" for name in names]
+
+def get_region_places(sido, sigungu=None, place_type="약국", current_datetime=None):
+    """
+    Fetches a province's (or one district's) places from the local DB as
+    Place records. With shards this reads only that sido's shard.
+    """
+    patterns = _address_patterns(sido, sigungu)
+
+    days = _list_days(current_datetime)
+    results = []
+    try:
+        dataset = current_dataset()
+        for db_file, _ in dataset.targets(sido=sido if SHARD_DIR else None):
+            conn = sqlite3.connect(db_file)
+            rows = conn.execute(f'''
+                SELECT {', '.join(_list_columns(days, schedule_ids=dataset.has_schedule_ids(db_file)))} FROM places
+                WHERE type = ? AND ({' OR '.join(['dutyAddr LIKE ?'] * len(patterns))})
+                ORDER BY dutyName
+            ''', [place_type] + patterns).fetchall()
+            conn.close()
+            results += [_place_from_row(row, days) for row in rows]
+    except Exception as e:
+        print(f"Error fetching region places: {e}")
+        return []
+    return results
+
+def _nearby_ranked(db_file, index_file, dataset, lat, lon, radius_km, bbox, place_type, limit,
+                   open_only, current_datetime, days):
+    """
+    Nearest-first places of one DB, ranked inside SQLite: the dot product of
+    the stored unit vectors with the origin's orders by great-circle distance
+    and `dot >= cos(radius)` is the exact radius test. Rows are pulled in
+    batches until `limit` places (open ones, with open_only) are collected,
+    so only those cross into Python.
+    """
+    ux, uy, uz = unit_vector(lat, lon)
+    min_dot = math.cos(min(radius_km / EARTH_RADIUS_KM, math.pi))
+    conn = sqlite3.connect(db_file)
+    cursor = conn.execute(f'''
+        SELECT {', '.join(_list_columns(days, schedule_ids=dataset.has_schedule_ids(db_file)))},
+               x * ? + y * ? + z * ? AS dot FROM places
+        WHERE type = ?
+        AND wgs84Lat BETWEEN ? AND ?
+        AND wgs84Lon BETWEEN ? AND ?
+        AND dot >= ?
+        ORDER BY dot DESC
+        {"" if open_only else "LIMIT ?"}
+    ''', (ux, uy, uz, place_type, *bbox, min_dot) + (() if open_only else (limit,)))
+    # Read while the query holds its read lock, so it describes these rows
+    db_version = _index_version(conn) if open_only else None
+
+    results = []
+    while len(results) < limit:
+        rows = cursor.fetchmany(limit)
+        if not rows:
+            break
+        batch = [_place_from_row(row[:-1], days) for row in rows]
+        if open_only:
+            batch = filter_open_places(batch, current_datetime, index_file, dataset, db_version)
+        results += batch
+    conn.close()
+
+    results = results[:limit]
+    for place in results:
+        place.distance = haversine(lat, lon, place.lat, place.lon)
+    return results
+
+@profile_hook("get_nearby_places")
+def get_nearby_places(lat, lon, radius_km, place_type="약국", limit=1000, open_only=False, current_datetime=None):
+    """
+    Fetches places within radius_km from the local DB as Place records.
+    Optimized with a bounding box query first; DBs with unit vector columns
+    rank and limit in SQL (see _nearby_ranked).
+    open_only: keep only places open at current_datetime (default: now),
+               using the time-slot open index.
     """
     try:
-        conn = sqlite3.connect(DB_FILE)
-        conn.row_factory = sqlite3.Row # Access columns by name
-        cursor = conn.cursor()
-        
         # 1. Bounding Box Filter (Approximate)
-        # 1 degree lat ~= 111km
-        # 1 degree lon ~= 111km * cos(lat)
-        delta_lat = radius_km / 111.0
-        delta_lon = radius_km / (111.0 * math.cos(math.radians(lat)))
-        
-        min_lat = lat - delta_lat
-        max_lat = lat + delta_lat
-        min_lon = lon - delta_lon
-        max_lon = lon + delta_lon
-        
-        cursor.execute('''
-            SELECT * FROM places 
-            WHERE type = ? 
-            AND wgs84Lat BETWEEN ? AND ?
-            AND wgs84Lon BETWEEN ? AND ?
-        ''', (place_type, min_lat, max_lat, min_lon, max_lon))
-        
-        rows = cursor.fetchall()
-        conn.close()
-        
-        results = []
-        for row in rows:
-            # Convert Row to Dict
-            item = dict(row)
-            
-            # Calculate Exact Distance
-            p_lat = item['wgs84Lat']
-            p_lon = item['wgs84Lon']
-            
-            if p_lat is None or p_lon is None:
+        bbox = _bounding_box(lat, lon, radius_km)
+        days = _list_days(current_datetime)
+
+        dataset = current_dataset()
+        per_target = []
+        for db_file, index_file in dataset.targets(bbox):
+            if dataset.has_unit_vectors(db_file):
+                per_target.append(_nearby_ranked(db_file, index_file, dataset, lat, lon, radius_km, bbox,
+                                                 place_type, limit, open_only, current_datetime, days))
                 continue
-                
-            dist = haversine(lat, lon, p_lat, p_lon)
-            
-            if dist <= radius_km:
-                item['distance'] = dist
-                results.append(item)
-        
-        # Sort by distance
-        results.sort(key=lambda x: x['distance'])
-        
-        return results[:limit]
+
+            # Older DB without x, y, z: distances in Python
+            conn = sqlite3.connect(db_file)
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT {', '.join(_list_columns(days, schedule_ids=dataset.has_schedule_ids(db_file)))} FROM places 
+                WHERE type = ? 
+                AND wgs84Lat BETWEEN ? AND ?
+                AND wgs84Lon BETWEEN ? AND ?
+            ''', (place_type, *bbox))
+            rows = cursor.fetchall()
+            # Read after the rows: a rewrite in between unstamps the DB, never the reverse
+            db_version = _index_version(conn)
+            conn.close()
+
+            results = []
+            for row in rows:
+                # Calculate Exact Distance (columns 5, 6 = wgs84Lat, wgs84Lon)
+                dist = haversine(lat, lon, row[5], row[6])
+
+                if dist <= radius_km:
+                    place = _place_from_row(row, days)
+                    place.distance = dist
+                    results.append(place)
+
+            # rowids are per file, so the open index is applied per shard
+            if open_only:
+                results = filter_open_places(results, current_datetime, index_file, dataset, db_version)
+
+            # Sort by distance
+            results.sort(key=lambda x: x.distance)
+            per_target.append(results)
+
+        # Merge the per-shard lists (a single list without sharding)
+        return list(islice(heapq.merge(*per_target, key=lambda x: x.distance), limit))
         
     except Exception as e:
         print(f"Error fetching nearby places: {e}")
         return []
 
+def _bounding_box(lat, lon, radius_km):
+    """
+    Returns (min_lat, max_lat, min_lon, max_lon) around a point.
+    1 degree lat ~= 111km, 1 degree lon ~= 111km * cos(lat)
+    """
+    delta_lat = radius_km / 111.0
+    delta_lon = radius_km / (111.0 * math.cos(math.radians(lat)))
+    return lat - delta_lat, lat + delta_lat, lon - delta_lon, lon + delta_lon
+
+def iter_nearby_places(lat, lon, radius_km, place_type="약국", limit=1000, open_only=False, current_datetime=None,
+                       start_km=RING_START_KM, growth=RING_GROWTH):
+    """
+    Streaming get_nearby_places(): yields (band_km, places) for distance bands
+    that start at start_km and grow by `growth` up to radius_km, nearest first.
+    Each band holds the places farther than the previous band_km and at most
+    band_km away, sorted by distance; together the bands are
+    get_nearby_places()'s result. A band only scans the bounding box area
+    not covered by the previous one, so the first results arrive after a
+    start_km scan however large radius_km is. Stop iterating once you have enough.
+    """
+    if current_datetime is None:
+        current_datetime = datetime.now() # one clock for every band
+    connections = {}
+    try:
+        dataset = current_dataset()
+        days = _list_days(current_datetime)
+
+        pending = [] # fetched candidates beyond the bands yielded so far
+        prev_box = None
+        band_km = 0
+        yielded = 0
+
+        while band_km < radius_km and yielded < limit:
+            band_km = min(radius_km, band_km * growth if band_km else start_km)
+            box = _bounding_box(lat, lon, band_km)
+
+            sql = '''
+                FROM places
+                WHERE type = ?
+                AND wgs84Lat BETWEEN ? AND ?
+                AND wgs84Lon BETWEEN ? AND ?
+            '''
+            params = [place_type, *box]
+            if prev_box:
+                # Skip the area already scanned for the previous band
+                sql += " AND NOT (wgs84Lat BETWEEN ? AND ? AND wgs84Lon BETWEEN ? AND ?)"
+                params += list(prev_box)
+
+            # A shard first reached by this band has nothing inside prev_box
+            for db_file, index_file in dataset.targets(box):
+                if db_file not in connections:
+                    connections[db_file] = sqlite3.connect(db_file)
+                columns = _list_columns(days, schedule_ids=dataset.has_schedule_ids(db_file))
+                rows = connections[db_file].execute(f"SELECT {', '.join(columns)}" + sql, params).fetchall()
+                db_version = _index_version(connections[db_file]) # after the rows, as in get_nearby_places
+
+                ring_places = []
+                for row in rows:
+                    place = _place_from_row(row, days)
+                    place.distance = haversine(lat, lon, place.lat, place.lon)
+                    if place.distance <= radius_km:
+                        ring_places.append(place)
+                if open_only:
+                    ring_places = filter_open_places(ring_places, current_datetime, index_file, dataset, db_version)
+                pending += ring_places
+
+            # Box corners reach past band_km; those places wait for a later band
+            band = sorted((place for place in pending if place.distance <= band_km), key=lambda x: x.distance)
+            pending = [place for place in pending if place.distance > band_km]
+            band = band[:limit - yielded]
+            yielded += len(band)
+            prev_box = box
+            if band:
+                yield band_km, band
+
+    except Exception as e:
+        print(f"Error streaming nearby places: {e}")
+    finally:
+        for conn in connections.values():
+            conn.close()
+
+def find_nearest_places(lat, lon, n=100, place_type="약국", open_only=False, current_datetime=None,
+                        start_km=RING_START_KM, growth=RING_GROWTH, max_km=RING_MAX_KM):
+    """
+    Returns the n nearest places (optionally only open ones), nearest first.
+    Searches an expanding ring (iter_nearby_places bands): the radius starts
+    at start_km and grows by `growth` until n qualifying places lie inside it,
+    so rural queries widen until they find results and dense areas stop
+    after the first ring.
+    """
+    results = []
+    for _, band in iter_nearby_places(lat, lon, max_km, place_type, n, open_only, current_datetime,
+                                      start_km, growth):
+        results += band
+    return results
+
+def _hhmm_to_int(value):
+    """Converts a dutyTime value ('0900', 900) to an int, or -1 if missing."""
+    if not value:
+        return -1
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return -1
+
+def get_nearby_places_batch(origins, radius_km, place_type="약국", limit=100, times=None):
+    """
+    Answers many nearby queries at once (e.g. every district centroid x every hour).
+    All origins share a single candidate scan, and distances are computed
+    in vectorized blocks of BATCH_BLOCK_SIZE origins.
+
+    Args:
+        origins: sequence of (lat, lon)
+        radius_km: search radius applied to every origin
+        times: Optional. Sequence of datetimes, one per origin. When given,
+               only places open at that origin's time are returned.
+
+    Returns:
+        dict of numpy arrays (CSR layout):
+            "hpid": candidate place ids
+            "offsets": int64, len(origins) + 1. Results of origin i are
+                       index[offsets[i]:offsets[i+1]] / distance[offsets[i]:offsets[i+1]]
+            "index": int32 positions into "hpid", nearest first
+            "distance": float32 distances in km
+    """
+    origins = np.asarray(origins, dtype=np.float64).reshape(-1, 2)
+    n_origins = len(origins)
+    if times is not None and len(times) != n_origins:
+        raise ValueError("times must have one entry per origin")
+
+    empty = {
+        "hpid": np.array([], dtype=object),
+        "offsets": np.zeros(n_origins + 1, dtype=np.int64),
+        "index": np.array([], dtype=np.int32),
+        "distance": np.array([], dtype=np.float32),
+    }
+    if n_origins == 0:
+        return empty
+
+    # 1. Shared candidate scan over the union of all bounding boxes
+    max_abs_lat = float(np.abs(origins[:, 0]).max())
+    delta_lat = radius_km / 111.0
+    delta_lon = radius_km / (111.0 * math.cos(math.radians(min(max_abs_lat + delta_lat, 89.0))))
+
+    columns = ["hpid", "wgs84Lat", "wgs84Lon"]
+    if times is not None:
+        for i in range(1, 9):
+            columns += [f"dutyTime{i}s", f"dutyTime{i}c"]
+
+    bbox = (float(origins[:, 0].min()) - delta_lat, float(origins[:, 0].max()) + delta_lat,
+            float(origins[:, 1].min()) - delta_lon, float(origins[:, 1].max()) + delta_lon)
+
+    try:
+        rows = []
+        for db_file, _ in _db_targets(bbox):
+            conn = sqlite3.connect(db_file)
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT {', '.join(columns)} FROM places
+                WHERE type = ?
+                AND wgs84Lat BETWEEN ? AND ?
+                AND wgs84Lon BETWEEN ? AND ?
+            ''', (place_type, *bbox))
+            rows += cursor.fetchall()
+            conn.close()
+    except Exception as e:
+        print(f"Error fetching nearby places (batch): {e}")
+        return empty
+
+    if not rows:
+        return empty
+
+    hpids = np.array([row[0] for row in rows], dtype=object)
+    cand_lat = np.radians(np.array([row[1] for row in rows], dtype=np.float64))
+    cand_lon = np.radians(np.array([row[2] for row in rows], dtype=np.float64))
+    cand_cos_lat = np.cos(cand_lat)
+
+    # Opening hours as int matrices: column d-1 holds dutyTime{d}
+    if times is not None:
+        starts = np.array([[_hhmm_to_int(row[3 + 2 * d]) for d in range(8)] for row in rows], dtype=np.int32)
+        ends = np.array([[_hhmm_to_int(row[4 + 2 * d]) for d in range(8)] for row in rows], dtype=np.int32)
+        open_masks = {}
+        origin_open_keys = []
+        for when in times:
+            key = (schedule_day_index(when), int(when.strftime("%H%M")))
+            if key not in open_masks:
+                day, hhmm = key
+                s_col = starts[:, day - 1]
+                e_col = ends[:, day - 1]
+                open_masks[key] = (s_col >= 0) & (e_col >= 0) & (s_col <= hhmm) & (hhmm <= e_col)
+            origin_open_keys.append(key)
+
+    # 2. Vectorized haversine per block of origins
+    counts = np.zeros(n_origins, dtype=np.int64)
+    index_parts = []
+    distance_parts = []
+    origin_lat = np.radians(origins[:, 0])
+    origin_lon = np.radians(origins[:, 1])
+
+    for block_start in range(0, n_origins, BATCH_BLOCK_SIZE):
+        block = slice(block_start, block_start + BATCH_BLOCK_SIZE)
+        o_lat = origin_lat[block, None]
+        o_lon = origin_lon[block, None]
+
+        a = (np.sin((cand_lat - o_lat) / 2) ** 2
+             + np.cos(o_lat) * cand_cos_lat * np.sin((cand_lon - o_lon) / 2) ** 2)
+        dist = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+        for row_idx, origin_idx in enumerate(range(block_start, block_start + len(o_lat))):
+            within = dist[row_idx] <= radius_km
+            if times is not None:
+                within &= open_masks[origin_open_keys[origin_idx]]
+            cand_idx = np.flatnonzero(within)
+            cand_dist = dist[row_idx, cand_idx]
+
+            # Partial sort: only the closest `limit` need ordering
+            if limit is not None and len(cand_idx) > limit:
+                top = np.argpartition(cand_dist, limit - 1)[:limit]
+                cand_idx = cand_idx[top]
+                cand_dist = cand_dist[top]
+            order = np.argsort(cand_dist, kind="stable")
+
+            index_parts.append(cand_idx[order].astype(np.int32))
+            distance_parts.append(cand_dist[order].astype(np.float32))
+            counts[origin_idx] = len(order)
+
+    offsets = np.zeros(n_origins + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    return {
+        "hpid": hpids,
+        "offsets": offsets,
+        "index": np.concatenate(index_parts),
+        "distance": np.concatenate(distance_parts),
+    }
+
+def _bits_contain(packed, ids):
+    """Vectorized membership test of ids in a packed little-endian bitset."""
+    inside = ids < len(packed) * 8
+    result = np.zeros(len(ids), dtype=bool)
+    hits = ids[inside]
+    result[inside] = (packed[hits >> 3] >> (hits & 7)) & 1
+    return result
+
+def preload_open_slot(when):
+    """Loads the open-index slot for `when` of every DB/shard into memory. Returns how many."""
+    dataset = current_dataset()
+    slot = time_slot(when)
+    return sum(dataset.open_slot(slot, index_file) is not None for _, index_file in dataset.targets())
+
+def get_open_place_ids(current_datetime=None, index_file=None):
+    """
+    Looks up the open index for a time (default: now).
+    Returns (open_ids, boundary_ids) as numpy arrays of places.rowid:
+    places open for the whole 10-minute slot, and places that open or close
+    inside it (check those with is_open_now). Returns None without an index.
+    The ids are the loaded index's; check Dataset.index_matches before
+    applying them to rows.
+    """
+    if current_datetime is None:
+        current_datetime = datetime.now()
+    bits = current_dataset().open_slot(time_slot(current_datetime), index_file)
+    if bits is None:
+        return None
+    full, partial, _ = bits
+    return (np.flatnonzero(np.unpackbits(full, bitorder="little")),
+            np.flatnonzero(np.unpackbits(partial, bitorder="little")))
+
+def filter_open_places(items, current_datetime=None, index_file=None, dataset=None, db_version=None):
+    """
+    Keeps only the items open at current_datetime (default: now).
+    Items need a place_id (places.rowid of the DB that index_file was built
+    from, default OPEN_INDEX_FILE); dataset is the version they were read
+    from (default: the current one) and db_version the DB's _index_version()
+    read on the same connection. The candidate ids are intersected with the
+    open index bitsets; only places that open/close inside the slot, or that
+    are newer than the index, fall back to is_open_now (once per schedule).
+    All items do when the index doesn't match the DB (Dataset.index_matches).
+    """
+    if current_datetime is None:
+        current_datetime = datetime.now()
+    if not items:
+        return []
+
+    statuses = {}
+    dataset = dataset or current_dataset()
+    bits = None
+    if dataset.index_matches(index_file, db_version):
+        bits = dataset.open_slot(time_slot(current_datetime), index_file)
+    if bits is None:
+        return [item for item in items if _schedule_status(item, current_datetime, statuses)["is_open"]]
+
+    full, partial, size = bits
+    ids = np.array([item['place_id'] for item in items], dtype=np.int64)
+    sure = _bits_contain(full, ids)
+    maybe = _bits_contain(partial, ids) | (ids >= size)
+
+    return [
+        item for item, is_sure, is_maybe in zip(items, sure, maybe)
+        if is_sure or (is_maybe and _schedule_status(item, current_datetime, statuses)["is_open"])
+    ]
+
+def _query_transitions(conditions, place_type, lat=None, lon=None, radius_km=None, limit=1000):
+    """
+    Runs place_transitions lookups and returns matching places as Place records.
+    conditions: list of (sql, params, day_start) OR-ed together, each matched
+    against one dutyTime day; day_start is that day's midnight, used to turn
+    open_min/close_min into opens_at/closes_at datetimes.
+    """
+    try:
+        area_sql = ""
+        area_params = []
+        if lat is not None and lon is not None and radius_km is not None:
+            area_params = list(_bounding_box(lat, lon, radius_km))
+            area_sql = " AND p.wgs84Lat BETWEEN ? AND ? AND p.wgs84Lon BETWEEN ? AND ?"
+
+        results = []
+        dataset = current_dataset()
+        for db_file, _ in dataset.targets(area_params or None):
+            conn = sqlite3.connect(db_file)
+            cursor = conn.cursor()
+            schedule_ids = dataset.has_schedule_ids(db_file)
+            for condition_sql, params, day_start in conditions:
+                days = _list_days(day_start)
+                cursor.execute(f'''
+                    SELECT {', '.join(_list_columns(days, prefix="p.", schedule_ids=schedule_ids))},
+                           t.open_min, t.close_min
+                    FROM place_transitions t
+                    JOIN places p ON p.hpid = t.hpid
+                    WHERE {condition_sql}
+                    AND p.type = ?{area_sql}
+                ''', list(params) + [place_type] + area_params)
+
+                for row in cursor.fetchall():
+                    place = _place_from_row(row[:-2], days)
+                    place.opens_at = day_start + timedelta(minutes=row[-2])
+                    place.closes_at = day_start + timedelta(minutes=row[-1])
+                    if area_params:
+                        place.distance = haversine(lat, lon, place.lat, place.lon)
+                        if place.distance > radius_km:
+                            continue
+                    results.append(place)
+            conn.close()
+
+        if area_params:
+            results.sort(key=lambda x: x.distance)
+        return results[:limit]
+
+    except Exception as e:
+        print(f"Error querying opening transitions: {e}")
+        return []
+
+def _minute_of_day(when):
+    return when.hour * 60 + when.minute
+
+def _midnight(when):
+    return when.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def get_places_open_at(when, place_type="약국", lat=None, lon=None, radius_km=None, limit=1000):
+    """
+    Returns places open at an arbitrary time (e.g. 23:30 tonight).
+    Optionally restricted to radius_km around (lat, lon), nearest first.
+    """
+    minute = _minute_of_day(when)
+    conditions = [(
+        "t.day = ? AND t.open_min <= ? AND t.close_min >= ?",
+        (schedule_day_index(when), minute, minute),
+        _midnight(when),
+    )]
+    return _query_transitions(conditions, place_type, lat, lon, radius_km, limit)
+
+def get_places_opening_soon(within_minutes=30, current_datetime=None, place_type="약국",
+                            lat=None, lon=None, radius_km=None, limit=1000):
+    """
+    Returns places that open within the next `within_minutes`
+    (windows past midnight continue into the next day's hours).
+    Each result has opens_at / closes_at datetimes.
+    """
+    if current_datetime is None:
+        current_datetime = datetime.now()
+    minute = _minute_of_day(current_datetime)
+    window_end = minute + within_minutes
+    today = _midnight(current_datetime)
+
+    conditions = [(
+        "t.day = ? AND t.open_min > ? AND t.open_min <= ?",
+        (schedule_day_index(today), minute, min(window_end, 24 * 60 - 1)),
+        today,
+    )]
+    if window_end >= 24 * 60:
+        tomorrow = today + timedelta(days=1)
+        # Tomorrow's 00:00 opening of a place open right now is not an opening
+        conditions.append((
+            "t.day = ? AND t.open_min <= ? AND NOT EXISTS ("
+            "SELECT 1 FROM place_transitions c WHERE c.hpid = t.hpid AND c.day = ? "
+            "AND c.open_min <= ? AND c.close_min >= ?)",
+            (schedule_day_index(tomorrow), window_end - 24 * 60, schedule_day_index(today), minute, minute),
+            tomorrow,
+        ))
+    return _query_transitions(conditions, place_type, lat, lon, radius_km, limit)
+
+def get_places_closing_soon(within_minutes=30, current_datetime=None, place_type="약국",
+                            lat=None, lon=None, radius_km=None, limit=1000):
+    """
+    Returns places open now that close within the next `within_minutes`.
+    Hours ending at 23:59/24:00 that continue from 00:00 the next day are one
+    opening: such a place closes when tomorrow's hours end (e.g. 24-hour
+    pharmacies don't close at midnight).
+    Each result has opens_at / closes_at datetimes.
+    """
+    if current_datetime is None:
+        current_datetime = datetime.now()
+    minute = _minute_of_day(current_datetime)
+    window_end = minute + within_minutes
+    today = _midnight(current_datetime)
+    tomorrow = today + timedelta(days=1)
+
+    # close_min past 24:00 (e.g. '2600') is kept on today's row
+    conditions = [(
+        "t.day = ? AND t.close_min BETWEEN ? AND ? AND t.open_min <= ? AND NOT ("
+        "t.close_min >= ? AND EXISTS (SELECT 1 FROM place_transitions n WHERE n.hpid = t.hpid "
+        "AND n.day = ? AND n.open_min = 0 AND n.close_min > ?))",
+        (schedule_day_index(today), minute, window_end, minute,
+         DAY_END_MINUTE, schedule_day_index(tomorrow), window_end - 24 * 60),
+        today,
+    )]
+    if window_end >= 24 * 60:
+        conditions.append((
+            "t.day = ? AND t.open_min = 0 AND t.close_min <= ? AND EXISTS ("
+            "SELECT 1 FROM place_transitions c WHERE c.hpid = t.hpid AND c.day = ? "
+            "AND c.open_min <= ? AND c.close_min >= ?)",
+            (schedule_day_index(tomorrow), window_end - 24 * 60,
+             schedule_day_index(today), minute, DAY_END_MINUTE),
+            tomorrow,
+        ))
+    results = _query_transitions(conditions, place_type, lat, lon, radius_km, limit)
+
+    # A period ending at 24:00 that continues from 00:00 tomorrow is one opening
+    merged = {}
+    for place in results:
+        first = merged.setdefault(place.hpid, place)
+        first.opens_at = min(first.opens_at, place.opens_at)
+        first.closes_at = max(first.closes_at, place.closes_at)
+    return list(merged.values())
+
+class ResultCache:
+    """
+    Thread-safe LRU cache with a TTL for query results, bounded by entries
+    and by the rows (list items) they hold together.
+    One instance (RESULT_CACHE) is shared by every session in the process.
+    """
+    def __init__(self, maxsize=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL, max_rows=RESULT_CACHE_MAX_ROWS):
+        self.maxsize = maxsize
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self._entries = OrderedDict() # key -> (expires_at, value, origin)
+        self._lock = threading.Lock()
+        self.rows = 0
+        self.hits = 0
+        self.misses = 0
+        self.warm_hits = 0 # hits on entries put there by the cache warmer
+        self.prefetch_hits = 0 # hits on entries put there by the prefetcher
+
+    def get(self, key):
+        """Returns (found, value)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            if entry[2] == "warm":
+                self.warm_hits += 1
+            elif entry[2] == "prefetch":
+                self.prefetch_hits += 1
+            return True, entry[1]
+
+    def contains(self, key):
+        """True if key has a live entry (not counted as a hit or miss)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[0] >= time.monotonic()
+
+    def put(self, key, value, ttl=None, warmed=False, prefetched=False):
+        """
+        ttl: Optional. Seconds to keep this entry (default: self.ttl).
+        warmed / prefetched: put by the cache warmer / prefetcher (for stats).
+        """
+        origin = "warm" if warmed else "prefetch" if prefetched else None
+        rows = _result_rows(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.rows -= _result_rows(old[1])
+            if rows > self.max_rows:
+                return # would evict everything else
+            self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value, origin)
+            self.rows += rows
+            while len(self._entries) > self.maxsize or self.rows > self.max_rows:
+                _, (_, evicted, _) = self._entries.popitem(last=False)
+                self.rows -= _result_rows(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.rows = 0
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "warm_hits": self.warm_hits,
+                    "prefetch_hits": self.prefetch_hits, "size": len(self._entries), "rows": self.rows}
+
+def _result_rows(value):
+    """Rows a cached result holds, for RESULT_CACHE_MAX_ROWS."""
+    return len(value) if isinstance(value, (list, tuple)) else 1
+
+RESULT_CACHE = ResultCache()
+
+def cache_key(func, args, kwargs, cache_tag=None):
+    """
+    The RESULT_CACHE key run_cached() uses for func(*args, **kwargs).
+    Includes the dataset generation, so results never outlive a reload.
+    """
+    return (func.__name__, tuple(args), tuple(sorted(kwargs.items())), cache_tag,
+            current_dataset().generation)
+
+def day_tag(when=None):
+    """
+    cache_tag for results that are not keyed by a time slot: list queries
+    only load the day's dutyTime columns, so a result must not outlive its day.
+    """
+    return (when or datetime.now()).strftime("%Y-%m-%d")
+
+def run_cached(func, *args, cache_tag=None, **kwargs):
+    """
+    Calls func(*args, **kwargs) through RESULT_CACHE.
+    cache_tag: extra key part for results that depend on something other than
+               the arguments (e.g. the current time slot for open-only queries).
+    Cached results are shared between sessions; callers must not mutate them.
+    """
+    key = cache_key(func, args, kwargs, cache_tag)
+    found, value = RESULT_CACHE.get(key)
+    if found:
+        return value
+    value = func(*args, **kwargs)
+    RESULT_CACHE.put(key, value, ttl=result_ttl(value))
+    return value
+
+def is_fallback(value):
+    """True for a RegionPlaces served from the local DB because the live API failed."""
+    return getattr(value, "source", None) == "fallback"
+
+def result_ttl(value):
+    """
+    TTL to cache a result with (None: the cache default). A fallback is only
+    kept FALLBACK_CACHE_TTL, so sessions go back to live data shortly after
+    the API recovers.
+    """
+    return FALLBACK_CACHE_TTL if is_fallback(value) else None
+
+# --- Speculative prefetch ---
+
+def _tile_index(value):
+    return round(value / PREFETCH_TILE_DEG)
+
+def _tile_center(index):
+    return round(index * PREFETCH_TILE_DEG, 6)
+
+def tile_of(lat, lon):
+    """Centre (tile_lat, tile_lon) of the PREFETCH_TILE_DEG tile containing a point."""
+    return _tile_center(_tile_index(lat)), _tile_center(_tile_index(lon))
+
+def _tile_margin_km(tile_lat):
+    """Farthest any point of a tile at tile_lat lies from the tile centre."""
+    half = PREFETCH_TILE_DEG / 2
+    return max(haversine(tile_lat, 0, tile_lat + half, half), haversine(tile_lat, 0, tile_lat - half, half))
+
+def get_tile_places(tile_lat, tile_lon, radius_km, place_type="약국", current_datetime=None):
+    """
+    Every place within radius_km of some point of the PREFETCH_TILE_DEG tile
+    centred on (tile_lat, tile_lon): the candidates of any radius query made
+    from inside that tile. current_datetime picks the day whose hours are loaded.
+    Returns None for a tile with TILE_PLACES_LIMIT or more candidates: cut off
+    at the limit it can't answer queries, and caching None keeps it from
+    being fetched again without holding its rows.
+    """
+    places = get_nearby_places(tile_lat, tile_lon, radius_km + _tile_margin_km(tile_lat), place_type,
+                               limit=TILE_PLACES_LIMIT, current_datetime=current_datetime)
+    return None if len(places) >= TILE_PLACES_LIMIT else places
+
+def nearby_from_tiles(lat, lon, radius_km, place_type="약국", limit=1000, open_only=False, current_datetime=None):
+    """
+    get_nearby_places() answered from the prefetched tile containing (lat, lon),
+    or None when that tile is not in RESULT_CACHE. Returns copies, so the
+    distances set here don't leak into the shared tile.
+    """
+    key = cache_key(get_tile_places, tile_of(lat, lon) + (radius_km, place_type), {}, day_tag(current_datetime))
+    if not RESULT_CACHE.contains(key):
+        return None
+    found, candidates = RESULT_CACHE.get(key)
+    if not found or candidates is None:
+        return None # expired meanwhile, or too many candidates for a tile
+
+    if current_datetime is None:
+        current_datetime = datetime.now()
+    statuses = {}
+    results = []
+    for candidate in candidates:
+        distance = haversine(lat, lon, candidate.lat, candidate.lon)
+        if distance > radius_km:
+            continue
+        if open_only and not _schedule_status(candidate, current_datetime, statuses)["is_open"]:
+            continue
+        place = copy.copy(candidate)
+        place.distance = distance
+        results.append(place)
+    results.sort(key=lambda x: x.distance)
+    return results[:limit]
+
+class Prefetcher:
+    """
+    Runs the queries a user is likely to make next into RESULT_CACHE on a
+    small thread pool. Each owner (browser session) has one batch at a time:
+    a new batch cancels whatever of the previous one has not started, so a
+    user who moves on leaves no backlog behind.
+    """
+    def __init__(self, workers=PREFETCH_WORKERS, max_pending=PREFETCH_MAX_PENDING, cache=RESULT_CACHE):
+        self.cache = cache
+        self.max_pending = max_pending
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self._batches = {} # owner -> futures of its latest batch
+        self._lock = threading.Lock()
+        self.counts = {"submitted": 0, "fetched": 0, "cancelled": 0, "skipped": 0, "fallbacks": 0, "errors": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def submit(self, owner, calls):
+        """
+        Replaces owner's batch. calls: (func, args, kwargs, cache_tag) tuples,
+        most likely first; the tail is dropped when the pool is backed up.
+        """
+        with self._lock:
+            for future in self._batches.pop(owner, []):
+                if future.cancel():
+                    self.counts["cancelled"] += 1
+            # Forget owners whose batches have finished
+            for other in [o for o, batch in self._batches.items() if all(f.done() for f in batch)]:
+                del self._batches[other]
+            pending = sum(not f.done() for batch in self._batches.values() for f in batch)
+
+            futures = []
+            for func, args, kwargs, cache_tag in calls:
+                if pending + len(futures) >= self.max_pending:
+                    break
+                key = cache_key(func, args, kwargs, cache_tag)
+                if self.cache.contains(key):
+                    self.counts["skipped"] += 1
+                    continue
+                futures.append(self._pool.submit(self._run, key, func, args, kwargs))
+                self.counts["submitted"] += 1
+            self._batches[owner] = futures
+
+    def _run(self, key, func, args, kwargs):
+        if self.cache.contains(key):
+            self._count("skipped")
+            return
+        try:
+            value = func(*args, **kwargs)
+            if is_fallback(value):
+                # Not worth caching ahead: the user's own request retries the live API
+                self._count("fallbacks")
+                return
+            self.cache.put(key, value, prefetched=True)
+            self._count("fetched")
+        except Exception as e:
+            self._count("errors")
+            print(f"Error prefetching {func.__name__}{args}: {e}")
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts)
+
+PREFETCHER = Prefetcher()
+
+def prefetch_region(owner, city, district, place_type="약국"):
+    """
+    After a district search: the other facility type there, then the
+    districts next to it in KOREA_ADMIN_DIVISIONS order.
+    """
+    if not PREFETCH_ENABLED:
+        return
+    tag = day_tag()
+    calls = [(get_live_region_places, (city, district, OTHER_TYPE[place_type]), {}, tag)]
+    districts = KOREA_ADMIN_DIVISIONS.get(city, [])
+    if district in districts:
+        i = districts.index(district)
+        for neighbour in districts[i + 1:i + 2] + districts[max(i - 1, 0):i]:
+            calls.append((get_live_region_places, (city, neighbour, place_type), {}, tag))
+    PREFETCHER.submit(owner, calls)
+
+def prefetch_nearby(owner, lat, lon, radius_km, place_type="약국", open_only=False, cache_tag=None):
+    """
+    After a radius search: the same search for the other facility type, then
+    the tile around the location and its 8 neighbours (see nearby_from_tiles),
+    nearest tiles first.
+    """
+    if not PREFETCH_ENABLED:
+        return
+    calls = [(get_nearby_places, (lat, lon, radius_km),
+              {"place_type": OTHER_TYPE[place_type], "open_only": open_only}, cache_tag)]
+    if radius_km <= PREFETCH_TILE_MAX_KM:
+        lat_i, lon_i = _tile_index(lat), _tile_index(lon)
+        tiles = sorted(
+            ((lat_i + dy, lon_i + dx) for dy in (-1, 0, 1) for dx in (-1, 0, 1)),
+            key=lambda t: haversine(lat, lon, _tile_center(t[0]), _tile_center(t[1]))
+        )
+        calls += [(get_tile_places, (_tile_center(i), _tile_center(j), radius_km, place_type), {}, day_tag())
+                  for i, j in tiles]
+    PREFETCHER.submit(owner, calls)
+
+def prefetch_nearest(owner, lat, lon, n, place_type="약국", open_only=False, cache_tag=None):
+    """After a nearest-first search: the same search for the other facility type."""
+    if not PREFETCH_ENABLED:
+        return
+    PREFETCHER.submit(owner, [(find_nearest_places, (lat, lon),
+                               {"n": n, "place_type": OTHER_TYPE[place_type], "open_only": open_only},
+                               cache_tag)])
+
+def _fts_phrase(term):
+    """Quotes a user term as an FTS5 string."""
+    return '"' + term.replace('"', '""') + '"'
+
+def _like_contains(term):
+    """LIKE pattern (with ESCAPE '\\') matching term anywhere."""
+    return "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+def _is_korean(term):
+    return any("\uac00" <= ch <= "\ud7a3" or "\u3131" <= ch <= "\u318e" for ch in term)
+
+def search_places(query, place_type=None, sido=None, sigungu=None,
+                  lat=None, lon=None, radius_km=None, limit=50):
+    """
+    Ranked name/address search over the FTS5 indexes built by
+    collector.build_search_index(). Every whitespace-separated term must match:
+    terms of TRIGRAM_MIN_LENGTH+ characters match anywhere in dutyName/dutyAddr,
+    shorter ones match the start of a word. Short Korean terms match anywhere
+    too ("약" in "행복약국", which has no word start there) with a LIKE scan,
+    narrowed by the other terms and filters.
+
+    Optional filters: place_type, region (sido, sigungu) and radius_km around
+    (lat, lon); with a location each result also gets its distance.
+    Returns Place records, best match first.
+    """
+    terms = query.split()
+    if not terms:
+        return []
+    long_terms = [t for t in terms if len(t) >= TRIGRAM_MIN_LENGTH]
+    short_terms = [t for t in terms if len(t) < TRIGRAM_MIN_LENGTH]
+    # Korean words are whole names ("행복약국"): word-start matching misses most of them
+    scan_terms = [t for t in short_terms if _is_korean(t)]
+    prefix_terms = [t for t in short_terms if not _is_korean(t)]
+
+    # Rank with the trigram index when possible, the prefix index otherwise
+    days = _list_days()
+    fts_table = "places_fts" if long_terms else "places_fts_prefix" if prefix_terms else None
+    if fts_table:
+        match = " AND ".join(_fts_phrase(t) for t in long_terms) if long_terms else \
+            " AND ".join(_fts_phrase(t) + "*" for t in prefix_terms)
+        sql = f'''
+                   , p.dutyName LIKE ? AS name_first, bm25({fts_table}) AS score
+            FROM {fts_table} f
+            JOIN places p ON p.rowid = f.rowid
+            WHERE {fts_table} MATCH ?
+        '''
+        params = [terms[0] + "%", match]
+    else:
+        # Only short Korean terms: scan places, limited by the filters below
+        sql = '''
+                   , p.dutyName LIKE ? AS name_first, 0 AS score
+            FROM places p
+            WHERE 1 = 1
+        '''
+        params = [terms[0] + "%"]
+
+    if long_terms and prefix_terms:
+        sql += " AND p.rowid IN (SELECT rowid FROM places_fts_prefix WHERE places_fts_prefix MATCH ?)"
+        params.append(" AND ".join(_fts_phrase(t) + "*" for t in prefix_terms))
+    for term in scan_terms:
+        sql += " AND (p.dutyName LIKE ? ESCAPE '\\' OR p.dutyAddr LIKE ? ESCAPE '\\')"
+        params += [_like_contains(term)] * 2
+    if place_type:
+        sql += " AND p.type = ?"
+        params.append(place_type)
+    if sido:
+        patterns = _address_patterns(sido, sigungu)
+        sql += f" AND ({' OR '.join(['p.dutyAddr LIKE ?'] * len(patterns))})"
+        params += patterns
+
+    use_area = lat is not None and lon is not None and radius_km is not None
+    bbox = None
+    if use_area:
+        bbox = _bounding_box(lat, lon, radius_km)
+        sql += " AND p.wgs84Lat BETWEEN ? AND ? AND p.wgs84Lon BETWEEN ? AND ?"
+        params += list(bbox)
+
+    # Names that start with the query first, then BM25 relevance
+    sql += " ORDER BY name_first DESC, score"
+    if not use_area:
+        # Radius filtering happens after the query, so only limit in SQL without it
+        sql += " LIMIT ?"
+        params.append(limit)
+
+    try:
+        rows = []
+        dataset = current_dataset()
+        for db_file, _ in dataset.targets(bbox, sido=SIDO_ALIASES.get(sido, sido) if SHARD_DIR and sido else None):
+            columns = _list_columns(days, prefix="p.", schedule_ids=dataset.has_schedule_ids(db_file))
+            conn = sqlite3.connect(db_file)
+            rows += conn.execute(f"SELECT {', '.join(columns)}" + sql, params).fetchall()
+            conn.close()
+    except Exception as e:
+        print(f"Error searching places: {e}")
+        return []
+
+    # BM25 scores come from per-shard statistics; close enough to merge on
+    rows.sort(key=lambda row: (-row[-2], row[-1]))
+
+    results = []
+    for row in rows:
+        place = _place_from_row(row[:-2], days)
+        if lat is not None and lon is not None and place.lat is not None and place.lon is not None:
+            place.distance = haversine(lat, lon, place.lat, place.lon)
+            if use_area and place.distance > radius_km:
+                continue
+        results.append(place)
+        if len(results) >= limit:
+            break
+    return results
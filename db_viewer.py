@@ -1,8 +1,11 @@
 import sqlite3
 import pandas as pd
 import os
+import argparse
+from datetime import datetime
 
 DB_FILE = "hospital.db"
+PLACE_TYPES = ["약국", "병원"]
 
 def view_data():
     """
@@ -36,8 +39,158 @@ def view_data():
     except Exception as e:
         print(f"Error viewing database: {e}")
 
+def search_data(query, limit=20):
+    """
+    Name/address lookup through the FTS5 index (instead of LIKE '%...%' scans).
+    """
+    from data_loader import search_places
+
+    results = search_places(query, limit=limit)
+    return pd.DataFrame(
+        [(p.hpid, p.name, p.address, p.tel, p.type) for p in results],
+        columns=["hpid", "dutyName", "dutyAddr", "dutyTel1", "type"]
+    )
+
+def _region_filter(sido=None, sigungu=None, type_=None, alias="t"):
+    """WHERE fragment and params for the optional region/type filters."""
+    clauses = []
+    params = []
+    for column, value in (("sido", sido), ("sigungu", sigungu), ("type", type_)):
+        if value:
+            clauses.append(f"{alias}.{column} = ?")
+            params.append(value)
+    return (" AND " + " AND ".join(clauses)) if clauses else "", params
+
+def count_data(sido=None, sigungu=None, type_=None):
+    """
+    Facility counts per (sido, sigungu, type) from region_totals.
+    """
+    where, params = _region_filter(sido, sigungu, type_)
+    conn = sqlite3.connect(DB_FILE)
+    df = pd.read_sql_query(
+        f"SELECT t.sido, t.sigungu, t.type, t.total FROM region_totals t WHERE 1 = 1{where} "
+        "ORDER BY t.sido, t.sigungu, t.type",
+        conn, params=params
+    )
+    conn.close()
+    return df
+
+def coverage_data(at=None, sido=None, sigungu=None, type_=None):
+    """
+    Open facilities per district at a time (default: now), from region_open_counts.
+    Every district of KOREA_ADMIN_DIVISIONS is listed: one without facilities
+    of a type is in region_totals with no row, but shows here with total 0.
+    """
+    from utils import time_slot, KOREA_ADMIN_DIVISIONS
+
+    slot = time_slot(at or datetime.now())
+    where, params = _region_filter(sido, sigungu, type_)
+    conn = sqlite3.connect(DB_FILE)
+    df = pd.read_sql_query(
+        f'''
+        SELECT t.sido, t.sigungu, t.type, COALESCE(o.open_count, 0) AS open_count, t.total,
+               ROUND(100.0 * COALESCE(o.open_count, 0) / t.total, 1) AS open_pct
+        FROM region_totals t
+        LEFT JOIN region_open_counts o
+          ON o.slot = ? AND o.sido = t.sido AND o.sigungu = t.sigungu AND o.type = t.type
+        WHERE 1 = 1{where}
+        ORDER BY t.sido, t.sigungu, t.type
+        ''',
+        conn, params=[slot] + params
+    )
+    conn.close()
+
+    regions = pd.DataFrame(
+        [(s, g, t) for s, districts in KOREA_ADMIN_DIVISIONS.items() for g in districts for t in PLACE_TYPES
+         if (not sido or s == sido) and (not sigungu or g == sigungu) and (not type_ or t == type_)],
+        columns=["sido", "sigungu", "type"]
+    )
+    df = regions.merge(df, on=["sido", "sigungu", "type"], how="outer")
+    df[["open_count", "total"]] = df[["open_count", "total"]].fillna(0).astype(int)
+    df["open_pct"] = df["open_pct"].fillna(0.0)
+    return df.sort_values(["sido", "sigungu", "type"]).reset_index(drop=True)
+
+def gap_data(at=None, min_open=1, sido=None, type_=None):
+    """
+    Coverage gaps: districts with fewer than min_open facilities open at a time.
+    """
+    df = coverage_data(at, sido=sido, type_=type_)
+    return df[df["open_count"] < min_open].sort_values(["open_count", "total"], ascending=[True, False])
+
+def output(df, fmt="table", path=None):
+    """Prints or writes a result table as table / csv / json."""
+    if fmt == "csv":
+        text = df.to_csv(index=False)
+    elif fmt == "json":
+        text = df.to_json(orient="records", force_ascii=False, indent=2)
+    else:
+        text = "(no rows)" if df.empty else df.to_string(index=False)
+
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"Wrote {len(df)} rows to {path}")
+    else:
+        print(text)
+
+def _output_options(suppress=False):
+    """
+    --format / --output. Subcommands take them too, suppressed by default so
+    they don't reset what was given before the subcommand.
+    """
+    options = argparse.ArgumentParser(add_help=False)
+    options.add_argument("--format", choices=["table", "csv", "json"],
+                         default=argparse.SUPPRESS if suppress else "table")
+    options.add_argument("--output", default=argparse.SUPPRESS if suppress else None,
+                         help="write to a file instead of stdout")
+    return options
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="hospital.db 조회 / 지역 통계", parents=[_output_options()])
+    sub = parser.add_subparsers(dest="command")
+    output_options = _output_options(suppress=True)
+
+    sub.add_parser("summary", help="row counts and a sample (default)")
+
+    p_search = sub.add_parser("search", help="name/address search", parents=[output_options])
+    p_search.add_argument("terms", nargs="+")
+    p_search.add_argument("--limit", type=int, default=20)
+
+    def add_filters(p, sigungu=True):
+        p.add_argument("--sido")
+        if sigungu:
+            p.add_argument("--sigungu")
+        p.add_argument("--type", dest="type_", choices=PLACE_TYPES)
+
+    def add_time(p):
+        p.add_argument("--at", type=lambda v: datetime.strptime(v, "%Y-%m-%d %H:%M"),
+                       help='"YYYY-MM-DD HH:MM" (default: now)')
+
+    p_count = sub.add_parser("count", help="facilities per district", parents=[output_options])
+    add_filters(p_count)
+
+    p_cov = sub.add_parser("coverage", help="open facilities per district at a time", parents=[output_options])
+    add_filters(p_cov)
+    add_time(p_cov)
+
+    p_gaps = sub.add_parser("gaps", help="districts with too few open facilities", parents=[output_options])
+    add_filters(p_gaps, sigungu=False)
+    add_time(p_gaps)
+    p_gaps.add_argument("--min-open", type=int, default=1)
+
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
+    args = parse_args()
     if not os.path.exists(DB_FILE):
         print(f"Database {DB_FILE} not found. Run collector.py first.")
-    else:
+    elif args.command in (None, "summary"):
         view_data()
+    elif args.command == "search":
+        output(search_data(" ".join(args.terms), args.limit), args.format, args.output)
+    elif args.command == "count":
+        output(count_data(args.sido, args.sigungu, args.type_), args.format, args.output)
+    elif args.command == "coverage":
+        output(coverage_data(args.at, args.sido, args.sigungu, args.type_), args.format, args.output)
+    elif args.command == "gaps":
+        output(gap_data(args.at, args.min_open, args.sido, args.type_), args.format, args.output)
@@ -0,0 +1,306 @@
+"""
+Concurrent-session load test for main.py.
+
+Runs N headless Streamlit sessions (streamlit.testing AppTest) in one process
+against a synthetic local DB, each doing a random mix of realistic actions,
+and reports rerun latency percentiles, throughput and memory per session.
+
+AppTest swaps a process-global runtime in and out around every run, so the
+sessions' reruns are executed one at a time. Each session still runs in its
+own thread and queues for its turn: "latency" includes that wait (like
+reruns contending for the GIL in one server process), "service" is the
+rerun alone.
+
+    python load_test.py --sessions 20 --actions 15
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import sqlite3
+import argparse
+import tempfile
+import threading
+
+# The harness always runs on its own single synthetic DB
+os.environ["SHARD_DIR"] = ""
+os.environ.setdefault("CACHE_WARMER", "0")
+
+import numpy as np
+from streamlit.testing.v1 import AppTest
+import collector
+import data_loader
+from utils import KOREA_ADMIN_DIVISIONS
+
+APP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+RUN_TIMEOUT = 120 # seconds per rerun before AppTest gives up
+
+# AppTest is not safe to run concurrently (global Runtime / config state)
+_APPTEST_LOCK = threading.Lock()
+
+# Rough centre of each sido, for placing synthetic facilities
+SIDO_CENTERS = {
+    "서울특별시": (37.56, 126.98), "부산광역시": (35.18, 129.08), "대구광역시": (35.87, 128.60),
+    "인천광역시": (37.46, 126.71), "광주광역시": (35.16, 126.85), "대전광역시": (36.35, 127.38),
+    "울산광역시": (35.54, 129.31), "세종특별자치시": (36.48, 127.29), "경기도": (37.41, 127.52),
+    "강원특별자치도": (37.82, 128.16), "충청북도": (36.64, 127.49), "충청남도": (36.52, 126.80),
+    "전북특별자치도": (35.72, 127.15), "전라남도": (34.87, 126.99), "경상북도": (36.49, 128.89),
+    "경상남도": (35.46, 128.21), "제주특별자치도": (33.49, 126.50),
+}
+AUTO_RADIUS = 0 # main.AUTO_RADIUS (main.py only runs as a Streamlit script)
+SCHEDULES = [("0900", "1800"), ("0900", "2300"), ("1000", "1900"), ("0830", "2130"), ("0000", "2359")]
+
+# --- Synthetic data ---
+
+def build_synthetic_db(out_dir, n_places=50000, seed=0):
+    """
+    Creates hospital.db + open_index.db in out_dir with n_places random
+    pharmacies/hospitals spread over every sido, and builds the derived indexes.
+    """
+    rng = random.Random(seed)
+    db_file = os.path.join(out_dir, "hospital.db")
+    collector.init_db(db_file)
+
+    rows = []
+    sidos = [sido for sido in KOREA_ADMIN_DIVISIONS if sido in SIDO_CENTERS]
+    for i in range(n_places):
+        sido = rng.choice(sidos)
+        sigungu = rng.choice(KOREA_ADMIN_DIVISIONS[sido])
+        lat, lon = SIDO_CENTERS[sido]
+        row = [
+            f"LT{i:07d}",
+            f"{sigungu} {rng.choice(['온누리', '행복', '중앙', '24시', '365'])}{'약국' if i % 3 else '의원'} {i}",
+            f"{sido} {sigungu} 테스트로 {i}" if sigungu != sido else f"{sido} 테스트로 {i}",
+            "02-000-0000",
+            lat + rng.gauss(0, 0.15),
+            lon + rng.gauss(0, 0.15),
+        ]
+        weekday = rng.choice(SCHEDULES)
+        for day in range(1, 9):
+            if day <= 5:
+                start, close = weekday
+            else:
+                start, close = rng.choice(SCHEDULES + [(None, None)] * 3)
+            row += [start, close]
+        row.append("약국" if i % 3 else "병원")
+        rows.append(tuple(row))
+
+    columns = ["hpid", "dutyName", "dutyAddr", "dutyTel1", "wgs84Lat", "wgs84Lon"]
+    for day in range(1, 9):
+        columns += [f"dutyTime{day}s", f"dutyTime{day}c"]
+    columns.append("type")
+
+    conn = sqlite3.connect(db_file)
+    conn.executemany(
+        f"INSERT OR REPLACE INTO places ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})", rows
+    )
+    conn.commit()
+    conn.close()
+    collector.rebuild_derived(db_file, os.path.join(out_dir, "open_index.db"))
+    collector.set_dataset_meta("updated_at", time.strftime("%Y-%m-%d %H:%M:%S"), db_file)
+    return db_file
+
+# --- Session simulation ---
+
+def _button(at, label=None, key=None):
+    for button in at.button:
+        if (label is not None and button.label == label) or (key is not None and button.key == key):
+            return button
+    return None
+
+def _mode(at):
+    return at.session_state["search_mode"] if "search_mode" in at.session_state else "반경 검색"
+
+def act_switch_mode(at, rng):
+    mode = "지역 검색" if _mode(at) == "반경 검색" else "반경 검색"
+    return at.radio[0].set_value(mode).run()
+
+def act_pan(at, rng):
+    # What the map's on_change does: move the search centre
+    sido = rng.choice(list(SIDO_CENTERS))
+    lat, lon = SIDO_CENTERS[sido]
+    at.session_state["my_coords"] = [lat + rng.uniform(-0.1, 0.1), lon + rng.uniform(-0.1, 0.1)]
+    return at.run()
+
+def act_open_now(at, rng):
+    button = _button(at, label="⚡ 영업중인 약국")
+    return button.click().run() if button else at.run()
+
+def act_radius(at, rng):
+    selects = [s for s in at.selectbox if s.label == "반경"]
+    if not selects:
+        return at.run()
+    return selects[0].set_value(rng.choice([AUTO_RADIUS, 3, 5, 10])).run()
+
+def act_district(at, rng):
+    sido = rng.choice(list(SIDO_CENTERS))
+    at.session_state["city"] = sido
+    at.session_state["district"] = rng.choice(KOREA_ADMIN_DIVISIONS[sido])
+    return at.run()
+
+def act_detail(at, rng):
+    cards = [button for button in at.button if button.key and button.key.startswith("sel_")]
+    if not cards:
+        return at.run()
+    return rng.choice(cards[:12]).click().run()
+
+# Relative frequency of each action per mode
+ACTIONS = {
+    "반경 검색": [(act_pan, 4), (act_detail, 3), (act_open_now, 2), (act_radius, 1), (act_switch_mode, 1)],
+    "지역 검색": [(act_district, 3), (act_detail, 3), (act_switch_mode, 1)],
+}
+
+def run_session(session_id, n_actions, think, seed, results, start_barrier):
+    """One simulated user: initial page load, then n_actions random actions."""
+    rng = random.Random(seed + session_id)
+    timings = [] # (action, latency incl. queueing, service time)
+    errors = 0
+    at = AppTest.from_file(APP_FILE, default_timeout=RUN_TIMEOUT)
+    start_barrier.wait()
+
+    for step in range(n_actions + 1):
+        if step == 0:
+            action, do = "load", lambda at, rng: at.run()
+        else:
+            choices = ACTIONS[_mode(at)]
+            do = rng.choices([c[0] for c in choices], weights=[c[1] for c in choices])[0]
+            action = do.__name__[4:]
+        queued = time.perf_counter()
+        with _APPTEST_LOCK:
+            started = time.perf_counter()
+            try:
+                at = do(at, rng) or at
+                if at.exception:
+                    errors += 1
+            except Exception as e:
+                errors += 1
+                print(f"[session {session_id}] {action} failed: {e}")
+            finished = time.perf_counter()
+        timings.append((action, finished - queued, finished - started))
+        if think:
+            time.sleep(rng.uniform(0, think))
+
+    results[session_id] = {"timings": timings, "errors": errors, "app": at}
+
+# --- Reporting ---
+
+def _rss_mb():
+    """Current resident set size in MB (Linux /proc), else peak RSS, else None."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        return None
+
+def _percentiles(values):
+    values = np.asarray(values) * 1000
+    return {
+        "count": int(len(values)),
+        "p50_ms": round(float(np.percentile(values, 50)), 1),
+        "p90_ms": round(float(np.percentile(values, 90)), 1),
+        "p95_ms": round(float(np.percentile(values, 95)), 1),
+        "p99_ms": round(float(np.percentile(values, 99)), 1),
+        "max_ms": round(float(values.max()), 1),
+    }
+
+def run_load_test(sessions=10, actions=10, think=0.0, places=50000, seed=0, live_api=False):
+    """Builds the synthetic DB, runs the sessions concurrently and returns the report dict."""
+    work_dir = tempfile.mkdtemp(prefix="loadtest_")
+    cwd = os.getcwd()
+    try:
+        print(f"Building synthetic DB ({places} places) in {work_dir}...")
+        build_synthetic_db(work_dir, places, seed)
+        # main.py / data_loader read hospital.db from the working directory
+        os.chdir(work_dir)
+        data_loader.reload_dataset(force=True)
+        if not live_api:
+            # District searches go straight to the local-DB fallback
+            data_loader.API_BREAKER.reset_timeout = float("inf")
+            data_loader.API_BREAKER.opened_at = time.monotonic()
+
+        rss_before = _rss_mb()
+        results = {}
+        barrier = threading.Barrier(sessions)
+        threads = [
+            threading.Thread(target=run_session, args=(i, actions, think, seed, results, barrier))
+            for i in range(sessions)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+        rss_after = _rss_mb()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    timings = [t for r in results.values() for t in r["timings"]]
+    by_action = {}
+    for action, latency, _ in timings:
+        by_action.setdefault(action, []).append(latency)
+
+    report = {
+        "sessions": sessions,
+        "actions_per_session": actions,
+        "places": places,
+        "reruns": len(timings),
+        "errors": sum(r["errors"] for r in results.values()),
+        "wall_s": round(wall, 2),
+        "throughput_rps": round(len(timings) / wall, 2) if wall else None,
+        "latency": _percentiles([latency for _, latency, _ in timings]),
+        "service": _percentiles([service for _, _, service in timings]),
+        "latency_by_action": {action: _percentiles(values) for action, values in sorted(by_action.items())},
+        "rss_before_mb": round(rss_before, 1) if rss_before else None,
+        "rss_after_mb": round(rss_after, 1) if rss_after else None,
+        "rss_per_session_mb": round((rss_after - rss_before) / sessions, 2) if rss_before and rss_after else None,
+        "result_cache": data_loader.RESULT_CACHE.stats(),
+    }
+    return report
+
+def print_report(report):
+    lat = report["latency"]
+    print(f"\n=== Load test: {report['sessions']} sessions x {report['actions_per_session']} actions "
+          f"({report['places']} places) ===")
+    print(f"reruns {report['reruns']} / errors {report['errors']} in {report['wall_s']}s "
+          f"-> {report['throughput_rps']} reruns/s")
+    for name, stats in (("latency", lat), ("service", report["service"])):
+        print(f"{name:<8} p50 {stats['p50_ms']}ms  p90 {stats['p90_ms']}ms  p95 {stats['p95_ms']}ms  "
+              f"p99 {stats['p99_ms']}ms  max {stats['max_ms']}ms")
+    print(f"{'action':<14}{'n':>6}{'p50':>10}{'p95':>10}{'max':>10}")
+    for action, stats in report["latency_by_action"].items():
+        print(f"{action:<14}{stats['count']:>6}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['max_ms']:>10}")
+    if report["rss_per_session_mb"] is not None:
+        print(f"memory: RSS {report['rss_before_mb']} -> {report['rss_after_mb']} MB "
+              f"({report['rss_per_session_mb']} MB per session)")
+    cache = report["result_cache"]
+    print(f"result cache: hit {cache['hits']} / miss {cache['misses']} (prefetched {cache['prefetch_hits']})")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="main.py 동시 세션 부하 테스트")
+    parser.add_argument("--sessions", type=int, default=10, help="concurrent sessions")
+    parser.add_argument("--actions", type=int, default=10, help="actions per session after the first load")
+    parser.add_argument("--think", type=float, default=0.0, help="max random pause between actions (s)")
+    parser.add_argument("--places", type=int, default=50000, help="rows in the synthetic DB")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--live-api", action="store_true", help="let district searches call data.go.kr")
+    parser.add_argument("--json", help="also write the report to this file")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = run_load_test(args.sessions, args.actions, args.think, args.places, args.seed, args.live_api)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Report written to {args.json}")
+    sys.exit(1 if report["errors"] else 0)
@@ -1,37 +1,55 @@
 import streamlit as st
-from data_loader import get_real_pharmacy_list, get_real_hospital_list, get_nearby_places
-from utils import is_open_now, reverse_geocode, forward_geocode
+import streamlit.components.v1 as components
+from data_loader import (
+    get_live_region_places, get_nearby_places, find_nearest_places, iter_nearby_places,
+    run_cached, cache_key, day_tag, RESULT_CACHE, annotate_open_status, open_statuses, with_day_hours,
+    load_place_hours, place_operating_hours,
+    current_dataset, start_dataset_watcher,
+    nearby_from_tiles, prefetch_region, prefetch_nearby, prefetch_nearest, PREFETCHER
+)
+from utils import (
+    is_open_now, reverse_geocode, forward_geocode, format_next_opening, time_slot,
+    KOREA_ADMIN_DIVISIONS
+)
+from cache_warmer import start_cache_warmer, record_region_query, record_tile_query
+from profiling import start_profile, profiled
+from datetime import datetime
 import folium
 from folium.plugins import LocateControl
 from streamlit_folium import st_folium
 import pandas as pd
 import math
+import copy
+import uuid
 
 st.set_page_config(page_title="휴일지킴이", page_icon="🏥", layout="wide")
 
 # ... (CSS preserved) ...
 
-# --- Administrative Divisions ---
-# (KOREA_ADMIN_DIVISIONS preserved)
-KOREA_ADMIN_DIVISIONS = {
-    "서울특별시": ["강남구", "강동구", "강북구", "강서구", "관악구", "광진구", "구로구", "금천구", "노원구", "도봉구", "동대문구", "동작구", "마포구", "서대문구", "서초구", "성동구", "성북구", "송파구", "양천구", "영등포구", "용산구", "은평구", "종로구", "중구", "중랑구"],
-    "경기도": ["수원시", "성남시", "의정부시", "안양시", "부천시", "광명시", "평택시", "동두천시", "안산시", "고양시", "과천시", "구리시", "남양주시", "오산시", "시흥시", "군포시", "의왕시", "하남시", "용인시", "파주시", "이천시", "안성시", "김포시", "화성시", "광주시", "양주시", "포천시", "여주시", "연천군", "가평군", "양평군"],
-    "부산광역시": ["중구", "서구", "동구", "영도구", "부산진구", "동래구", "남구", "북구", "해운대구", "사하구", "금정구", "강서구", "연제구", "수영구", "사상구", "기장군"],
-    "대구광역시": ["중구", "동구", "서구", "남구", "북구", "수성구", "달서구", "달성군", "군위군"],
-    "인천광역시": ["중구", "동구", "미추홀구", "연수구", "남동구", "부평구", "계양구", "서구", "강화군", "옹진군"],
-    "광주광역시": ["동구", "서구", "남구", "북구", "광산구"],
-    "대전광역시": ["동구", "중구", "서구", "유성구", "대덕구"],
-    "울산광역시": ["중구", "남구", "동구", "북구", "울주군"],
-    "세종특별자치시": ["세종특별자치시"],
-    "강원특별자치도": ["춘천시", "원주시", "강릉시", "동해시", "태백시", "속초시", "삼척시", "홍천군", "횡성군", "영월군", "평창군", "정선군", "철원군", "화천군", "양구군", "인제군", "고성군", "양양군"],
-    "충청북도": ["청주시", "충주시", "제천시", "보은군", "옥천군", "영동군", "증평군", "진천군", "괴산군", "음성군", "단양군"],
-    "충청남도": ["천안시", "공주시", "보령시", "아산시", "서산시", "논산시", "계룡시", "당진시", "금산군", "부여군", "서천군", "청양군", "홍성군", "예산군", "태안군"],
-    "전북특별자치도": ["전주시", "군산시", "익산시", "정읍시", "남원시", "김제시", "완주군", "진안군", "무주군", "장수군", "임실군", "순창군", "고창군", "부안군"],
-    "전라남도": ["목포시", "여수시", "순천시", "나주시", "광양시", "담양군", "곡성군", "구례군", "고흥군", "보성군", "화순군", "장흥군", "강진군", "해남군", "영암군", "무안군", "함평군", "영광군", "장성군", "완도군", "진도군", "신안군"],
-    "경상북도": ["포항시", "경주시", "김천시", "안동시", "구미시", "영주시", "영천시", "상주시", "문경시", "경산시", "의성군", "청송군", "영양군", "영덕군", "청도군", "고령군", "성주군", "칠곡군", "예천군", "봉화군", "울진군", "울릉군"],
-    "경상남도": ["창원시", "진주시", "통영시", "사천시", "김해시", "밀양시", "거제시", "양산시", "의령군", "함안군", "창녕군", "고성군", "남해군", "하동군", "산청군", "함양군", "거창군", "합천군"],
-    "제주특별자치도": ["제주시", "서귀포시"]
-}
+AUTO_RADIUS = 0 # "가까운 순": expanding-ring search instead of a fixed radius
+MAX_RESULTS = 100
+PREVIEW_CARDS = 20 # cards (and map markers) drawn while a streamed search is still running
+
+# Opt-in profiling: ?profile=1 profiles every rerun while set, PROFILE_SAMPLE_RATE samples them.
+# Runs cut short use rerun() below; one ended by an exception is dropped on the next run.
+PROFILE_RERUN = bool(st.query_params.get("profile"))
+_interrupted_profile = st.session_state.pop("rerun_profile", None)
+if _interrupted_profile is not None:
+    _interrupted_profile.discard()
+st.session_state["rerun_profile"] = start_profile("rerun", force=PROFILE_RERUN)
+
+def rerun():
+    """st.rerun() that first stops and discards this run's profile (the script won't reach its end)."""
+    profile = st.session_state.pop("rerun_profile", None)
+    if profile is not None:
+        profile.discard()
+    st.rerun()
+
+# Picks up a new hospital.db / snapshot without restarting (once per process)
+start_dataset_watcher()
+
+# Pre-warms popular searches before Sunday-evening / holiday peaks (once per process)
+CACHE_WARMER = start_cache_warmer()
 
 # --- Session State Initialization ---
 if "city" not in st.session_state:
@@ -49,6 +67,13 @@ if "radius_km" not in st.session_state:
 if "my_coords" not in st.session_state:
     # Default: Gyeonggi-do Yongin-si City Hall approx
     st.session_state["my_coords"] = [37.241086, 127.177553]
+if "session_id" not in st.session_state:
+    # Owner of this session's prefetches (a new query cancels the previous ones)
+    st.session_state["session_id"] = uuid.uuid4().hex
+if "rerun_counts" not in st.session_state:
+    st.session_state["rerun_counts"] = {"full": 0, "fragment": 0, "seen_full": 0}
+
+st.session_state["rerun_counts"]["full"] += 1
 
 # --- Sticky Header Section ---
 sticky_container = st.container()
@@ -63,7 +88,7 @@ with sticky_container:
         mode = st.radio("검색 모드", ["반경 검색", "지역 검색"], horizontal=True, label_visibility="collapsed")
         if mode != st.session_state["search_mode"]:
             st.session_state["search_mode"] = mode
-            st.rerun()
+            rerun()
 
     st.markdown("---", unsafe_allow_html=True) # Divider
 
@@ -100,25 +125,30 @@ with sticky_container:
             st.session_state["district"] = new_district
             st.session_state["selected_pharmacy"] = None
             st.session_state["show_map"] = False
-            st.rerun()
+            rerun()
             
 
     else: # Radius Search
         col1, col2, col3, col4, col5 = st.columns([1, 1, 1.2, 0.8, 1.5]) # Adjusted widths
         with col1:
              st.markdown("**반경 설정**")
-             rad_opts = [3, 5, 10, 500]
+             rad_opts = [AUTO_RADIUS, 3, 5, 10, 500]
              curr_rad = st.session_state.get("radius_km", 3)
              try:
                  idx = rad_opts.index(curr_rad)
              except ValueError:
                  idx = 0
              
-             radius = st.selectbox("반경", rad_opts, format_func=lambda x: f"{x}km" if x < 100 else "전국", index=idx, label_visibility="collapsed")
+             def format_radius(x):
+                 if x == AUTO_RADIUS:
+                     return "가까운 순"
+                 return f"{x}km" if x < 100 else "전국"
+
+             radius = st.selectbox("반경", rad_opts, format_func=format_radius, index=idx, label_visibility="collapsed")
              if radius != st.session_state.get("radius_km"):
                  st.session_state["radius_km"] = radius
                  st.session_state["filter_open_only"] = False # Reset if manually changed
-                 st.rerun()
+                 rerun()
                  
         with col2:
              st.markdown("**위치 설정**")
@@ -133,7 +163,9 @@ with sticky_container:
         with col4:
              st.write("") # Spacer
              st.write("") # Spacer
-             if st.session_state['radius_km'] >= 500:
+             if st.session_state['radius_km'] == AUTO_RADIUS:
+                  st.caption(f"가까운 {MAX_RESULTS}곳")
+             elif st.session_state['radius_km'] >= 500:
                   st.caption("범위: 전국")
              else:
                   st.caption(f"반경 {st.session_state['radius_km']}km")
@@ -143,7 +175,7 @@ with sticky_container:
              
              def set_quick_action():
                  st.session_state["type_radius"] = "약국"
-                 st.session_state["radius_km"] = 500 # Nationwide
+                 st.session_state["radius_km"] = AUTO_RADIUS # Nearest open, widening as needed
                  st.session_state["filter_open_only"] = True # Filter On
 
              st.button("⚡ 영업중인 약국", use_container_width=True, on_click=set_quick_action)
@@ -163,92 +195,208 @@ with sticky_container:
 
 
 # --- Data Fetching ---
-data_list = []
-search_source = ""
+def fetch_data(search_type):
+    """
+    Runs the current search through the process-wide result cache.
+    Returns (data_list, search_source, freshness); freshness is a caption
+    telling live API results from the stored-DB fallback (None for DB searches).
+    """
+    open_only = bool(st.session_state.get("filter_open_only"))
 
-if st.session_state["search_mode"] == "지역 검색":
-    city = st.session_state["city"]
-    district = st.session_state["district"]
-    search_source = f"{city} {district}"
-    
-    with st.spinner(f"{search_source} 데이터 불러오는 중..."):
-        if search_type == "약국":
-            data_list = get_real_pharmacy_list(city, district)
+    if st.session_state["search_mode"] == "지역 검색":
+        city = st.session_state["city"]
+        district = st.session_state["district"]
+        search_source = f"{city} {district}"
+
+        record_region_query(get_live_region_places, city, district, search_type)
+        with st.spinner(f"{search_source} 데이터 불러오는 중..."):
+            places = run_cached(get_live_region_places, city, district, search_type, cache_tag=day_tag())
+        prefetch_region(st.session_state["session_id"], city, district, search_type)
+        if places.source == "live":
+            freshness = f"🟢 실시간 조회 ({places.updated_at})"
         else:
-            data_list = get_real_hospital_list(city, district)
+            freshness = f"🟡 실시간 조회 지연 - 저장된 데이터 표시 (수집: {places.updated_at or '알 수 없음'})"
+        return places, search_source, freshness
 
-else: # Radius Search
+    # Radius Search
     lat, lon = st.session_state["my_coords"]
     radius = st.session_state["radius_km"]
+    # Open-only results depend on the clock; key them by the open-index time slot.
+    # Others only by the day (list queries load that day's hours).
+    tag = time_slot(datetime.now()) if open_only else day_tag()
+
+    if radius == AUTO_RADIUS:
+        search_source = "현재 위치에서 가까운 순"
+        with st.spinner(f"주변 {search_type} 검색 중... (DB)"):
+            places = run_cached(
+                find_nearest_places, lat, lon, n=MAX_RESULTS, place_type=search_type,
+                open_only=open_only, cache_tag=tag
+            )
+        prefetch_nearest(st.session_state["session_id"], lat, lon, MAX_RESULTS, search_type, open_only, tag)
+        return places, search_source, None
+
     search_source = f"현재 위치 반경 {radius}km"
-    
-    with st.spinner(f"주변 {search_type} 검색 중... (DB)"):
-        data_list = get_nearby_places(lat, lon, radius, place_type=search_type)
+    record_tile_query(lat, lon, radius, search_type)
+    # A pan inside an already prefetched map tile is answered from that tile
+    places = nearby_from_tiles(lat, lon, radius, place_type=search_type, open_only=open_only)
+    key = cache_key(get_nearby_places, (lat, lon, radius), {"place_type": search_type, "open_only": open_only}, tag)
+    # A stream stopped at a full page depends on who is open: keyed by time slot
+    page_key = cache_key(stream_nearby, (lat, lon, radius),
+                         {"place_type": search_type, "open_only": open_only, "page": MAX_RESULTS},
+                         time_slot(datetime.now()))
+    if places is None and RESULT_CACHE.contains(page_key):
+        _, places = RESULT_CACHE.get(page_key) # None if it expired just now
+    if places is None and not RESULT_CACHE.contains(key):
+        places = stream_nearby(lat, lon, radius, search_type, open_only, key, page_key)
+    if places is None:
+        with st.spinner(f"주변 {search_type} 검색 중... (DB)"):
+            places = run_cached(
+                get_nearby_places, lat, lon, radius, place_type=search_type,
+                open_only=open_only, cache_tag=tag
+            )
+    prefetch_nearby(st.session_state["session_id"], lat, lon, radius, search_type, open_only, tag)
+    return places, search_source, None
+
+def render_preview(placeholder, places, band_km):
+    """
+    Widget-free cards (and map markers) of the places found so far, in the
+    order process_data() will show them. Redrawn as each band arrives.
+    """
+    shown = sorted(places, key=lambda x: (not x.is_open, x.distance))[:PREVIEW_CARDS]
+    with placeholder.container():
+        st.caption(f"⏳ {band_km:g}km 이내 {len(places)}곳 - 더 먼 곳 검색 중...")
+        cols = st.columns(4)
+        for idx, item in enumerate(shown):
+            with cols[idx % 4]:
+                status_badge = "<span class='status-badge-open'>영업중</span>" if item.is_open else f"<span class='status-badge-closed'>{item.status_msg}</span>"
+                st.markdown(f"**{item.name}** {status_badge}<br>📏 {item.distance:.1f}km", unsafe_allow_html=True)
+        if st.session_state["show_map"] and shown:
+            st.map(pd.DataFrame({"lat": [p.lat for p in shown], "lon": [p.lon for p in shown]}))
+
+def stream_nearby(lat, lon, radius, search_type, open_only, key, page_key):
+    """
+    Runs an uncached radius search band by band (iter_nearby_places), nearest
+    first, previewing the results so far while farther bands load. Stops
+    once MAX_RESULTS open places are in: process_data() lists open places
+    nearest first, so farther bands could not change the page. A search that
+    runs to the end is cached under `key` like run_cached() would, one that
+    stopped early under `page_key` (only valid for this page and time slot).
+    """
+    preview = st.empty()
+    places = []
+    shown = [] # annotated copies for the preview; `places` stays clean for the cache
+    for band_km, band in iter_nearby_places(lat, lon, radius, place_type=search_type, open_only=open_only):
+        places += band
+        shown += annotate_open_status([copy.copy(place) for place in with_day_hours(band)])
+        if sum(1 for p in shown if p.is_open) >= MAX_RESULTS:
+            RESULT_CACHE.put(page_key, places)
+            break
+        if band_km < radius:
+            render_preview(preview, shown, band_km)
+    else:
+        RESULT_CACHE.put(key, places)
+    preview.empty()
+    return places
+
+def process_data(places):
+    """
+    Applies the open-only filter, sorts and keeps the top MAX_RESULTS. Open
+    status is computed without touching the Place records (they are shared
+    with other sessions through the result cache); only the rows kept are
+    copied to carry it.
+    """
+    now = datetime.now()
+    places = with_day_hours(places, now) # a list fetched before midnight lacks today's hours
+    rows = list(zip(open_statuses(places, now), places))
 
-# Process Data
-processed_data = []
-for item in data_list:
-    status = is_open_now(item)
-    
     # Filter Open Only Logic
-    if st.session_state.get("filter_open_only") and not status["is_open"]:
-        continue # Skip closed places
-        
-    name = item.get("dutyName") or item.get("yadmNm")
-    addr = item.get("dutyAddr") or item.get("addr")
-    tel = item.get("dutyTel1") or item.get("telno")
-    lat = item.get("wgs84Lat") or item.get("YPos")
-    lon = item.get("wgs84Lon") or item.get("XPos")
-    dist = item.get("distance")
-    
-    # Sunday Check (dutyTime7s exists and is valid)
-    is_sunday = False
-    if item.get("dutyTime7s") and item.get("dutyTime7c"):
-        is_sunday = True
-
-    if lat and lon:
-        processed_data.append({
-            "name": name, 
-            "address": addr, 
-            "tel": tel,
-            "lat": float(lat), 
-            "lon": float(lon),
-            "is_open": status["is_open"], 
-            "status_msg": status["message"],
-            "distance": dist,
-            "is_sunday": is_sunday,
-            "raw": item
-        })
+    if st.session_state.get("filter_open_only"):
+        rows = [row for row in rows if row[0]["is_open"]]
 
-# Sort
-if st.session_state["search_mode"] == "지역 검색":
-    processed_data.sort(key=lambda x: x["is_open"], reverse=True)
-else:
-    processed_data.sort(key=lambda x: (not x["is_open"], x.get("distance", 999)))
+    # Sort (sorted() builds a new list; the cached list keeps its order)
+    if st.session_state["search_mode"] == "지역 검색":
+        rows = sorted(rows, key=lambda row: row[0]["is_open"], reverse=True)
+    else:
+        rows = sorted(rows, key=lambda row: (not row[0]["is_open"], row[1].distance if row[1].distance is not None else 999))
 
-# Auto Select Top Logic (for Quick Action)
+    # Limit to top 100 results for performance
+    processed_data = []
+    for status, place in rows[:MAX_RESULTS]:
+        place = copy.copy(place)
+        place.is_open = status["is_open"]
+        place.status_msg = status["message"]
+        processed_data.append(place)
+    return processed_data
 
-from utils import is_open_now, reverse_geocode, forward_geocode, format_operating_hours
+def get_processed_data(search_type):
+    """
+    Session-scoped cache of the processed rows. Fragment reruns (card clicks,
+    map toggles) reuse them; they are rebuilt when the query changes, the
+    minute rolls over (open status depends on the clock) or the dataset is reloaded.
+    """
+    query_key = (
+        st.session_state["search_mode"], search_type,
+        st.session_state["city"], st.session_state["district"],
+        tuple(st.session_state["my_coords"]), st.session_state["radius_km"],
+        bool(st.session_state.get("filter_open_only")),
+        datetime.now().strftime("%Y%m%d%H%M"),
+        current_dataset().generation,
+    )
+    cached = st.session_state.get("processed_cache")
+    if cached and cached[0] == query_key:
+        return cached[1:]
 
-# Limit to top 100 results for performance
-processed_data = processed_data[:100]
+    data_list, search_source, freshness = fetch_data(search_type)
+    processed_data = process_data(data_list)
+    st.session_state["processed_cache"] = (query_key, processed_data, search_source, freshness)
+    return processed_data, search_source, freshness
 
 # --- Main Layout ---
+# Widgets inside results_section use callbacks instead of st.rerun(), so a click
+# or map pan only reruns the fragment.
+
+def select_place(item):
+    st.session_state["selected_pharmacy"] = item
+    st.session_state["show_map"] = False
 
-# 1. Detail View
-if st.session_state["selected_pharmacy"]:
+def open_map():
+    st.session_state["show_map"] = True
+
+def on_map_change():
+    """Updates the search location in Radius Mode when the map is panned."""
+    map_data = st.session_state.get("result_map")
+    if st.session_state["search_mode"] != "반경 검색" or not map_data:
+        return
+    new_center = map_data.get("center")
+    if new_center:
+        # Check if moved significantly to avoid loop
+        current_lat, current_lon = st.session_state["my_coords"]
+        new_lat = new_center["lat"]
+        new_lon = new_center["lng"]
+        
+        # Update only if moved > 0.0001 deg (~10m)
+        if abs(new_lat - current_lat) > 0.0001 or abs(new_lon - current_lon) > 0.0001:
+             st.session_state["my_coords"] = [new_lat, new_lon]
+
+def render_detail_view():
     sel = st.session_state["selected_pharmacy"]
     with st.container(border=True):
-        st.markdown(f"### 🏥 {sel['name']}")
-        st.markdown(f"**상태**: <span style='color:{'green' if sel['is_open'] else 'red'}'>{sel['status_msg']}</span>", unsafe_allow_html=True)
+        # The list query only loaded today's hours; fetch the full schedule now
+        load_place_hours(sel)
+        st.markdown(f"### 🏥 {sel.name}")
+        st.markdown(f"**상태**: <span style='color:{'green' if sel.is_open else 'red'}'>{sel.status_msg}</span>", unsafe_allow_html=True)
+        if not sel.is_open:
+            next_opening = format_next_opening(sel)
+            if next_opening:
+                st.caption(f"🕒 {next_opening}")
         c1, c2 = st.columns([2, 1])
         with c1:
-            st.write(f"📍 {sel['address']}")
-            st.write(f"📞 {sel['tel']}")
+            st.write(f"📍 {sel.address}")
+            st.write(f"📞 {sel.tel}")
             
             # Operating Hours Expander
             with st.expander("🕒 영업 시간 보기"):
-                hours_list = format_operating_hours(sel['raw'])
+                hours_list = place_operating_hours(sel)
                 if hours_list:
                     for h in hours_list:
                         st.text(h)
@@ -258,7 +406,6 @@ if st.session_state["selected_pharmacy"]:
         with c2:
              sub_c1, sub_c2, sub_c3 = st.columns(3)
              with sub_c1:
-                 import streamlit.components.v1 as components
                  html_code = f"""
                  <!DOCTYPE html>
                  <html style="height: 100%; margin: 0; overflow: hidden;">
@@ -266,7 +413,7 @@ if st.session_state["selected_pharmacy"]:
                     <button id="copy_btn" onclick="copyAddress()" style="width: 100%; height: 100%; background-color: white; border: 1px solid rgba(49, 51, 63, 0.2); border-radius: 0.5rem; cursor: pointer;">📋 주소복사</button>
                     <script>
                         function copyAddress() {{
-                            navigator.clipboard.writeText('{sel['address']}').then(() => {{
+                            navigator.clipboard.writeText('{sel.address}').then(() => {{
                                 document.getElementById("copy_btn").innerHTML = "✅ 완료!";
                                 setTimeout(() => {{ document.getElementById("copy_btn").innerHTML = "📋 주소복사"; }}, 2000);
                             }});
@@ -277,17 +424,18 @@ if st.session_state["selected_pharmacy"]:
                  """
                  components.html(html_code, height=42)
              with sub_c2:
-                 st.link_button("📞", f"tel:{sel['tel']}", use_container_width=True)
+                 st.link_button("📞", f"tel:{sel.tel}", use_container_width=True)
              with sub_c3:
-                 if st.button("🗺️", key="btn_show_map", use_container_width=True):
-                     st.session_state["show_map"] = True
-                     st.rerun()
+                 st.button("🗺️", key="btn_show_map", use_container_width=True, on_click=open_map)
     st.markdown("---")
 
-# 2. Grid View
-if not processed_data:
-    st.info("검색 결과가 없습니다.")
-else:
+def render_grid(processed_data, search_source, freshness=None):
+    if freshness:
+        st.caption(freshness)
+    if not processed_data:
+        st.info("검색 결과가 없습니다.")
+        return
+
     st.subheader(f"{search_source} 목록 ({len(processed_data)}곳)")
     cols = st.columns(4)
     for idx, item in enumerate(processed_data):
@@ -295,32 +443,28 @@ else:
         with cols[col_idx]:
             with st.container(border=True):
                 # Hidden Marker for CSS Targeting
-                marker_class = "is-open" if item["is_open"] else "is-closed"
+                marker_class = "is-open" if item.is_open else "is-closed"
                 st.markdown(f'<div class="{marker_class}" style="display:none;"></div>', unsafe_allow_html=True)
                 
                 # Title & Status
                 # Layout for Title/Status
                 t_col1, t_col2 = st.columns([3, 1])
                 with t_col1:
-                     sunday_badge = " <span style='background-color:#ffebee; color:#c62828; padding:2px 4px; border-radius:4px; font-size:0.8em; border:1px solid #ffcdd2;'>🌞일요일</span>" if item["is_sunday"] else ""
-                     st.markdown(f"**{item['name']}**{sunday_badge}", unsafe_allow_html=True)
+                     sunday_badge = " <span style='background-color:#ffebee; color:#c62828; padding:2px 4px; border-radius:4px; font-size:0.8em; border:1px solid #ffcdd2;'>🌞일요일</span>" if item.is_sunday else ""
+                     st.markdown(f"**{item.name}**{sunday_badge}", unsafe_allow_html=True)
                 with t_col2:
                      # Status Badge
-                     status_badge = f"<span class='status-badge-open'>영업중</span>" if item["is_open"] else f"<span class='status-badge-closed'>{item['status_msg']}</span>"
+                     status_badge = f"<span class='status-badge-open'>영업중</span>" if item.is_open else f"<span class='status-badge-closed'>{item.status_msg}</span>"
                      st.markdown(f"{status_badge}", unsafe_allow_html=True)
                 
                 # Distance Badge (Radius Mode Only)
-                if item.get("distance") is not None:
-                    st.caption(f"📏 {item['distance']:.1f}km")
+                if item.distance is not None:
+                    st.caption(f"📏 {item.distance:.1f}km")
 
                 # Select Button
-                if st.button("상세보기", key=f"sel_{idx}"):
-                    st.session_state["selected_pharmacy"] = item
-                    st.session_state["show_map"] = False 
-                    st.rerun()
+                st.button("상세보기", key=f"sel_{idx}", on_click=select_place, args=(item,))
 
-# --- Bottom Map Section ---
-if st.session_state["show_map"]: 
+def render_map(processed_data, search_type):
     st.markdown("---")
     st.subheader("🗺️ 지도 보기")
     
@@ -340,20 +484,20 @@ if st.session_state["show_map"]:
         
         for p in processed_data[:20]: 
              markers_to_show.append({
-                 "loc": [p["lat"], p["lon"]],
-                 "popup": p["name"],
+                 "loc": [p.lat, p.lon],
+                 "popup": p.name,
                  "icon": "plus" if "병원" in search_type else "medkit", 
-                 "color": "green" if p["is_open"] else "red"
+                 "color": "green" if p.is_open else "red"
              })
              
     elif st.session_state["selected_pharmacy"]:
         sel = st.session_state["selected_pharmacy"]
-        start_loc = [sel["lat"], sel["lon"]]
+        start_loc = [sel.lat, sel.lon]
         markers_to_show.append({
             "loc": start_loc,
-            "popup": sel["name"],
+            "popup": sel.name,
             "icon": "info-sign",
-            "color": "green" if sel["is_open"] else "red"
+            "color": "green" if sel.is_open else "red"
         })
 
     m = folium.Map(location=start_loc, zoom_start=zoom)
@@ -369,20 +513,53 @@ if st.session_state["show_map"]:
             icon=folium.Icon(color=mk["color"], icon=mk["icon"])
         ).add_to(m)
     
-    # Render with center capture
-    map_data = st_folium(m, width="100%", height=400, returned_objects=["last_object_clicked", "center"])
-    
-    # Input for updating location in Radius Mode
-    if st.session_state["search_mode"] == "반경 검색" and map_data:
-        new_center = map_data.get("center")
-        if new_center:
-            # Check if moved significantly to avoid loop
-            current_lat, current_lon = st.session_state["my_coords"]
-            new_lat = new_center["lat"]
-            new_lon = new_center["lng"]
-            
-            # Update only if moved > 0.0001 deg (~10m)
-            if abs(new_lat - current_lat) > 0.0001 or abs(new_lon - current_lon) > 0.0001:
-                 st.session_state["my_coords"] = [new_lat, new_lon]
-                 st.rerun()
+    # Render with center capture; panning is handled by on_map_change
+    st_folium(m, key="result_map", width="100%", height=400,
+              returned_objects=["last_object_clicked", "center"], on_change=on_map_change)
+
+@st.fragment
+def results_section(search_type):
+    """
+    Detail view, result grid and map. Reruns on its own for card selection
+    and map panning, so the header widgets are not rebuilt.
+    """
+    # A run that sees the same full-run count as the previous one is a fragment-only rerun
+    counts = st.session_state["rerun_counts"]
+    if counts["seen_full"] == counts["full"]:
+        counts["fragment"] += 1
+    counts["seen_full"] = counts["full"]
+
+    # Fragment-only reruns are profiled on their own; inside a full rerun this is a no-op
+    with profiled("fragment", force=PROFILE_RERUN):
+        processed_data, search_source, freshness = get_processed_data(search_type)
+
+        # 1. Detail View
+        if st.session_state["selected_pharmacy"]:
+            render_detail_view()
+
+        # 2. Grid View
+        render_grid(processed_data, search_source, freshness)
+
+        # --- Bottom Map Section ---
+        if st.session_state["show_map"]: 
+            render_map(processed_data, search_type)
+
+        if st.query_params.get("debug"):
+            cache = RESULT_CACHE.stats()
+            warmer = CACHE_WARMER.report()
+            prefetch = PREFETCHER.stats()
+            st.caption(
+                f"rerun: 전체 {counts['full']}회 / 부분 {counts['fragment']}회 · "
+                f"cache: hit {cache['hits']} / miss {cache['misses']} "
+                f"(warm {cache['warm_hits']}, prefetch {cache['prefetch_hits']}) · "
+                f"warmer: {warmer['runs']}회 {warmer['warmed']}건, 다음 피크 {warmer['next_peak'] or '-'} · "
+                f"prefetch: {prefetch['fetched']}건 (취소 {prefetch['cancelled']})"
+            )
+
+results_section(search_type)
 
+rerun_profile = st.session_state.pop("rerun_profile", None)
+if rerun_profile is not None:
+    profile_path = rerun_profile.stop()
+    if PROFILE_RERUN:
+        st.caption(f"profile: {profile_path}.prof")
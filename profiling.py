@@ -0,0 +1,205 @@
+import os
+import sys
+import json
+import time
+import random
+import pstats
+import cProfile
+import argparse
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+
+# Opt-in profiling: PROFILE_SAMPLE_RATE=0.05 profiles ~5% of hooked calls,
+# main.py's ?profile=1 forces one rerun. Dumps go to PROFILE_DIR.
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_MEMORY = os.getenv("PROFILE_MEMORY", "1") != "0" # tracemalloc alongside cProfile
+TRACE_FRAMES = 1 # tracemalloc stack depth; deeper stacks cost more
+TOP_ALLOCATIONS = 25
+
+_local = threading.local() # the profile active on this thread, if any
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+
+def _should_sample(force):
+    return force or (PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE)
+
+def _start_tracemalloc():
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACE_FRAMES)
+        _tracemalloc_users += 1
+
+def _stop_tracemalloc():
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0:
+            tracemalloc.stop()
+
+class Profile:
+    """
+    One sampled profiling run: cProfile for CPU and, with PROFILE_MEMORY,
+    tracemalloc snapshots before/after for the top allocation sites.
+    tracemalloc is process-wide, so allocations of concurrent requests show
+    up in each other's reports; the cProfile part is per thread.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.started_at = datetime.now()
+        self.profiler = cProfile.Profile()
+        self.memory = PROFILE_MEMORY
+        self.done = False
+        self._before = None
+
+    def start(self):
+        _local.active = self
+        if self.memory:
+            _start_tracemalloc()
+            tracemalloc.reset_peak()
+            self._before = tracemalloc.take_snapshot()
+        self._t0 = time.perf_counter()
+        self.profiler.enable()
+        return self
+
+    def _finish(self):
+        self.profiler.disable()
+        self.done = True
+        if getattr(_local, "active", None) is self:
+            _local.active = None
+
+    def discard(self):
+        """Stops without writing anything (e.g. a rerun interrupted by st.rerun)."""
+        if self.done:
+            return
+        self._finish()
+        if self.memory:
+            _stop_tracemalloc()
+
+    def stop(self):
+        """Stops and writes the dumps. Returns the path prefix."""
+        if self.done:
+            return None
+        elapsed = time.perf_counter() - self._t0
+        self._finish()
+
+        report = {
+            "name": self.name,
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "elapsed_ms": round(elapsed * 1000, 2),
+            "pid": os.getpid(),
+        }
+        if self.memory:
+            after = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            _stop_tracemalloc()
+            report["peak_kb"] = round(peak / 1024, 1)
+            report["allocations"] = [
+                {
+                    "where": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                    "size_kb": round(stat.size_diff / 1024, 1),
+                    "count": stat.count_diff,
+                }
+                for stat in after.compare_to(self._before, "lineno")[:TOP_ALLOCATIONS]
+            ]
+
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        prefix = os.path.join(
+            PROFILE_DIR, f"{self.started_at:%Y%m%d-%H%M%S-%f}_{self.name}_{os.getpid()}"
+        )
+        self.profiler.dump_stats(prefix + ".prof")
+        with open(prefix + ".json", "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        return prefix
+
+def start_profile(name, force=False):
+    """
+    Starts a sampled Profile for `name`, or returns None when this call is not
+    sampled or the thread is already being profiled (the outer run covers it).
+    """
+    if getattr(_local, "active", None) is not None or not _should_sample(force):
+        return None
+    return Profile(name).start()
+
+@contextmanager
+def profiled(name, force=False):
+    """Profiles the block when sampled (see start_profile)."""
+    profile = start_profile(name, force)
+    try:
+        yield profile
+    finally:
+        if profile is not None:
+            profile.stop()
+
+def profile_hook(name):
+    """Decorator form of profiled(); nearly free when the call is not sampled."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with profiled(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# --- Summaries ---
+
+def _dumps(directory, name=None):
+    if not os.path.isdir(directory):
+        return []
+    files = sorted(f for f in os.listdir(directory) if f.endswith(".prof"))
+    if name:
+        # <timestamp>_<name>_<pid>.prof; hook names may contain underscores
+        files = [f for f in files if f.rsplit("_", 1)[0].split("_", 1)[1] == name]
+    return [os.path.join(directory, f) for f in files]
+
+def summarize(directory=PROFILE_DIR, name=None, top=20, sort="cumulative", out=sys.stdout):
+    """Prints a hot-function table and top allocation sites over all matching dumps."""
+    files = _dumps(directory, name)
+    if not files:
+        print(f"No profile dumps in {directory}.", file=out)
+        return
+
+    reports = []
+    for path in files:
+        meta = path[:-len(".prof")] + ".json"
+        if os.path.exists(meta):
+            with open(meta, encoding="utf-8") as f:
+                reports.append(json.load(f))
+
+    elapsed = sorted(r["elapsed_ms"] for r in reports)
+    print(f"=== {len(files)} runs{f' of {name}' if name else ''} ===", file=out)
+    if elapsed:
+        print(f"elapsed ms: median {elapsed[len(elapsed) // 2]}  max {elapsed[-1]}", file=out)
+
+    stats = pstats.Stats(*files)
+    key = {"cumulative": 3, "tottime": 2}[sort]
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][key], reverse=True)[:top]
+    print(f"\n{'calls':>9} {'tottime':>9} {'cumtime':>9} {'per run':>9}  function", file=out)
+    for (filename, lineno, func), (_, ncalls, tottime, cumtime, _) in rows:
+        where = f"{os.path.basename(filename)}:{lineno}({func})" if lineno else func
+        print(f"{ncalls:>9} {tottime:>9.3f} {cumtime:>9.3f} {cumtime / len(files):>9.4f}  {where}", file=out)
+
+    sites = {}
+    for report in reports:
+        for alloc in report.get("allocations", []):
+            entry = sites.setdefault(alloc["where"], [0.0, 0])
+            entry[0] += alloc["size_kb"]
+            entry[1] += alloc["count"]
+    if sites:
+        peaks = [r["peak_kb"] for r in reports if "peak_kb" in r]
+        print(f"\nTop allocation sites (peak traced {max(peaks)} KB):", file=out)
+        for where, (size_kb, count) in sorted(sites.items(), key=lambda item: item[1][0], reverse=True)[:top]:
+            print(f"{size_kb:>10.1f} KB {count:>8}  {where}", file=out)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize profile dumps")
+    parser.add_argument("--dir", default=PROFILE_DIR)
+    parser.add_argument("--name", help="only runs of this hook (rerun, get_nearby_places, fetch_and_save, ...)")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--sort", choices=["cumulative", "tottime"], default="cumulative")
+    args = parser.parse_args()
+    summarize(args.dir, args.name, args.top, args.sort)
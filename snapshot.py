@@ -0,0 +1,300 @@
+import os
+import json
+import gzip
+import hashlib
+import sqlite3
+import argparse
+import time
+import requests
+
+DB_FILE = "hospital.db"
+SNAPSHOT_DIR = "snapshots"
+MANIFEST = "manifest.json"
+KEEP_SNAPSHOTS = 2 # Full snapshots kept for bootstrapping new replicas
+KEEP_DELTAS = 30 # Deltas kept for replicas that fell behind
+INDEX_VERSION_KEY = "open_index_version" # collector.INDEX_VERSION_KEY
+HTTP_TIMEOUT = 30
+
+# --- Helpers ---
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+def _read_rows(conn):
+    """
+    Returns (columns, rows) of the places table in canonical order (by hpid).
+    """
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(places)")]
+    rows = conn.execute(f"SELECT {', '.join(columns)} FROM places ORDER BY hpid").fetchall()
+    return columns, rows
+
+def _row_line(row):
+    return json.dumps(list(row), ensure_ascii=False, separators=(",", ":"))
+
+def content_checksum(conn):
+    """SHA-256 of the places table content, independent of the SQLite file layout."""
+    digest = hashlib.sha256()
+    _, rows = _read_rows(conn)
+    for row in rows:
+        digest.update(_row_line(row).encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+def get_local_version(db_file):
+    """Snapshot version recorded in dataset_meta, or 0."""
+    if not os.path.exists(db_file):
+        return 0
+    try:
+        conn = sqlite3.connect(db_file)
+        row = conn.execute("SELECT value FROM dataset_meta WHERE key = 'snapshot_version'").fetchone()
+        conn.close()
+        return int(row[0]) if row else 0
+    except sqlite3.Error:
+        return 0
+
+def _set_local_version(conn, version):
+    conn.execute("CREATE TABLE IF NOT EXISTS dataset_meta (key TEXT PRIMARY KEY, value TEXT)")
+    conn.execute("INSERT OR REPLACE INTO dataset_meta (key, value) VALUES ('snapshot_version', ?)", (str(version),))
+
+def _load_manifest(out_dir):
+    path = os.path.join(out_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {"latest": 0, "versions": {}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def _write_atomic(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+# --- Publisher (collector side) ---
+
+def publish_snapshot(db_file=DB_FILE, out_dir=SNAPSHOT_DIR):
+    """
+    Publishes a new version of db_file into out_dir:
+      vNNNNNN.db.gz        full compressed copy (for new replicas)
+      vNNNNNN.rows.gz      canonical rows, used to diff the next version
+      vMMMMMM-vNNNNNN.delta.gz  row-level delta from the previous version
+    and updates manifest.json. Returns the published version (unchanged if
+    the places content did not change).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = _load_manifest(out_dir)
+    prev_version = manifest["latest"]
+    version = prev_version + 1
+
+    conn = sqlite3.connect(db_file)
+    columns, rows = _read_rows(conn)
+    lines = [_row_line(row) for row in rows]
+    checksum = _sha256("".join(line + "\n" for line in lines).encode("utf-8"))
+
+    prev_entry = manifest["versions"].get(str(prev_version))
+    if prev_entry and prev_entry["content_sha256"] == checksum:
+        conn.close()
+        print(f"Snapshot unchanged (v{prev_version}).")
+        return prev_version
+
+    conn.close()
+
+    entry = {
+        "version": version,
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "rows": len(rows),
+        "columns": columns,
+        "content_sha256": checksum,
+    }
+
+    # 1. Full snapshot (VACUUM INTO gives a consistent, compact copy)
+    tmp_db = os.path.join(out_dir, f"v{version:06d}.db.tmp")
+    if os.path.exists(tmp_db):
+        os.remove(tmp_db)
+    conn = sqlite3.connect(db_file)
+    conn.execute("VACUUM INTO ?", (tmp_db,))
+    conn.close()
+    # The copy carries its version; the source DB is stamped once everything is published
+    conn = sqlite3.connect(tmp_db)
+    _set_local_version(conn, version)
+    conn.commit()
+    conn.close()
+    with open(tmp_db, "rb") as f:
+        snapshot_data = gzip.compress(f.read())
+    os.remove(tmp_db)
+    entry["snapshot"] = f"v{version:06d}.db.gz"
+    entry["snapshot_sha256"] = _sha256(snapshot_data)
+    _write_atomic(os.path.join(out_dir, entry["snapshot"]), snapshot_data)
+
+    # 2. Canonical rows for the next diff
+    entry["rows_file"] = f"v{version:06d}.rows.gz"
+    _write_atomic(os.path.join(out_dir, entry["rows_file"]), gzip.compress("\n".join(lines).encode("utf-8")))
+
+    # 3. Delta from the previous version
+    if prev_entry and prev_entry.get("rows_file") and prev_entry["columns"] == columns:
+        with open(os.path.join(out_dir, prev_entry["rows_file"]), "rb") as f:
+            prev_lines = gzip.decompress(f.read()).decode("utf-8").split("\n")
+        hpid_idx = columns.index("hpid")
+        prev_by_id = {json.loads(line)[hpid_idx]: line for line in prev_lines if line}
+
+        upsert = []
+        current_ids = set()
+        for row, line in zip(rows, lines):
+            current_ids.add(row[hpid_idx])
+            if prev_by_id.get(row[hpid_idx]) != line:
+                upsert.append(list(row))
+        delete = sorted(set(prev_by_id) - current_ids)
+
+        delta = {"from": prev_version, "to": version, "columns": columns, "upsert": upsert, "delete": delete}
+        delta_data = gzip.compress(json.dumps(delta, ensure_ascii=False).encode("utf-8"))
+        entry["delta"] = f"v{prev_version:06d}-v{version:06d}.delta.gz"
+        entry["delta_sha256"] = _sha256(delta_data)
+        _write_atomic(os.path.join(out_dir, entry["delta"]), delta_data)
+        print(f"Delta v{prev_version}->v{version}: {len(upsert)} upserts, {len(delete)} deletes, {len(delta_data)} bytes")
+
+    manifest["versions"][str(version)] = entry
+    manifest["latest"] = version
+    _prune(manifest, out_dir)
+    _write_atomic(os.path.join(out_dir, MANIFEST), json.dumps(manifest, ensure_ascii=False, indent=2).encode("utf-8"))
+
+    conn = sqlite3.connect(db_file)
+    _set_local_version(conn, version)
+    conn.commit()
+    conn.close()
+    print(f"Snapshot v{version} published to {out_dir} ({len(snapshot_data)} bytes).")
+    return version
+
+def _prune(manifest, out_dir):
+    """Drops old full snapshots/row files and deltas beyond the retention limits."""
+    versions = sorted(int(v) for v in manifest["versions"])
+    for idx, version in enumerate(reversed(versions)):
+        entry = manifest["versions"][str(version)]
+        keys = []
+        if idx >= KEEP_SNAPSHOTS:
+            keys += ["snapshot", "rows_file"]
+        if idx >= KEEP_DELTAS:
+            keys += ["delta"]
+        for key in keys:
+            name = entry.pop(key, None)
+            entry.pop(f"{key}_sha256", None)
+            if name and os.path.exists(os.path.join(out_dir, name)):
+                os.remove(os.path.join(out_dir, name))
+
+# --- Sync client (replica side) ---
+
+def _fetch(source, name):
+    """Reads a published file from a directory or an http(s) base URL."""
+    if source.startswith(("http://", "https://")):
+        response = requests.get(f"{source.rstrip('/')}/{name}", timeout=HTTP_TIMEOUT)
+        response.raise_for_status()
+        return response.content
+    with open(os.path.join(source, name), "rb") as f:
+        return f.read()
+
+def _apply_deltas(db_file, source, manifest, local_version):
+    """
+    Applies deltas local_version -> latest in one transaction and verifies the
+    content checksum. Returns True on success, False if a full snapshot is needed.
+    """
+    latest = manifest["latest"]
+    deltas = []
+    for version in range(local_version + 1, latest + 1):
+        entry = manifest["versions"].get(str(version))
+        if not entry or not entry.get("delta"):
+            return False
+        data = _fetch(source, entry["delta"])
+        if _sha256(data) != entry["delta_sha256"]:
+            print(f"Checksum mismatch for {entry['delta']}.")
+            return False
+        deltas.append(json.loads(gzip.decompress(data).decode("utf-8")))
+
+    conn = sqlite3.connect(db_file)
+    try:
+        # An older replica schema (e.g. before x/y/z or schedule_id) can't take the
+        # rows as-is, and the checksum depends on the column order: use a full snapshot
+        local_columns = [row[1] for row in conn.execute("PRAGMA table_info(places)")]
+        if any(delta["columns"] != local_columns for delta in deltas):
+            print("Replica schema differs from the published one; full snapshot needed.")
+            return False
+        for delta in deltas:
+            columns = delta["columns"]
+            conn.executemany("DELETE FROM places WHERE hpid = ?", [(hpid,) for hpid in delta["delete"]])
+            conn.executemany(
+                f"INSERT OR REPLACE INTO places ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})",
+                [tuple(row) for row in delta["upsert"]]
+            )
+        if content_checksum(conn) != manifest["versions"][str(latest)]["content_sha256"]:
+            print("Content checksum mismatch after applying deltas.")
+            conn.rollback()
+            return False
+        _set_local_version(conn, latest)
+        # The rowids changed: unstamp the DB until its open index is rebuilt
+        conn.execute("DELETE FROM dataset_meta WHERE key = ?", (INDEX_VERSION_KEY,))
+        conn.commit()
+        moved = sum(len(d["upsert"]) + len(d["delete"]) for d in deltas)
+        print(f"Applied {len(deltas)} delta(s) v{local_version}->v{latest} ({moved} rows).")
+        return True
+    finally:
+        conn.close()
+
+def _install_snapshot(db_file, source, manifest):
+    """Downloads the latest full snapshot, verifies it and swaps it in atomically."""
+    entry = manifest["versions"][str(manifest["latest"])]
+    data = _fetch(source, entry["snapshot"])
+    if _sha256(data) != entry["snapshot_sha256"]:
+        raise ValueError(f"Checksum mismatch for {entry['snapshot']}")
+    tmp_file = db_file + ".sync"
+    with open(tmp_file, "wb") as f:
+        f.write(gzip.decompress(data))
+    # The publisher's open index stamp doesn't describe this replica's index
+    conn = sqlite3.connect(tmp_file)
+    conn.execute("DELETE FROM dataset_meta WHERE key = ?", (INDEX_VERSION_KEY,))
+    conn.commit()
+    conn.close()
+    os.replace(tmp_file, db_file)
+    print(f"Installed full snapshot v{entry['version']} ({len(data)} bytes).")
+
+def sync_replica(source, db_file=DB_FILE, index_file=None):
+    """
+    Brings a replica's db_file up to the latest published version.
+    Uses deltas when the local version is still covered by them, otherwise
+    the full snapshot. Derived indexes are rebuilt after a delta update.
+    Returns the local version after syncing.
+    """
+    manifest = json.loads(_fetch(source, MANIFEST).decode("utf-8"))
+    latest = manifest["latest"]
+    local_version = get_local_version(db_file)
+
+    if local_version == latest:
+        print(f"Replica is up to date (v{latest}).")
+        return latest
+
+    # Imported here: collector imports this module when publishing
+    from collector import rebuild_derived, build_open_index, OPEN_INDEX_FILE
+    if index_file is None:
+        index_file = os.path.join(os.path.dirname(db_file), OPEN_INDEX_FILE)
+
+    if local_version and local_version < latest and _apply_deltas(db_file, source, manifest, local_version):
+        rebuild_derived(db_file, index_file)
+    else:
+        _install_snapshot(db_file, source, manifest)
+        # The open index lives next to the DB, not inside the snapshot
+        build_open_index(db_file, index_file)
+    return latest
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Snapshot publishing / replica sync")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_pub = sub.add_parser("publish", help="publish a new snapshot version")
+    p_pub.add_argument("--db", default=DB_FILE)
+    p_pub.add_argument("--out", default=SNAPSHOT_DIR)
+
+    p_sync = sub.add_parser("sync", help="update a replica from a snapshot directory or URL")
+    p_sync.add_argument("source")
+    p_sync.add_argument("--db", default=DB_FILE)
+
+    args = parser.parse_args()
+    if args.command == "publish":
+        publish_snapshot(args.db, args.out)
+    else:
+        sync_replica(args.source, args.db)
@@ -77,6 +77,47 @@ def test_mock_data():
         status = is_open_now(item)
         print(f"Hospital: {item['yadmNm']} -> {status['message']}")
 
+def test_midnight_transitions(tmp_path, monkeypatch):
+    """Hours through midnight are one opening, not a close at 24:00 and a reopening at 00:00."""
+    import sqlite3
+    from datetime import datetime
+    import collector
+    import data_loader
+    from utils import next_transition
+
+    monday = {"ALL": ("0000", "2400"), "LATE": ("0900", "2359"), "EARLY": ("0900", "1800"), "EVENING": ("0900", "2350")}
+    tuesday = {"ALL": ("0000", "2400"), "LATE": ("0000", "0005"), "EARLY": ("0000", "0900"), "EVENING": ("0900", "2350")}
+    db_file = str(tmp_path / "hospital.db")
+    collector.init_db(db_file)
+    conn = sqlite3.connect(db_file)
+    for hpid in monday:
+        conn.execute(
+            "INSERT INTO places (hpid, dutyName, dutyAddr, wgs84Lat, wgs84Lon, type, "
+            "dutyTime1s, dutyTime1c, dutyTime2s, dutyTime2c) VALUES (?, ?, '서울특별시 중구', 37.56, 126.98, '약국', ?, ?, ?, ?)",
+            (hpid, hpid) + monday[hpid] + tuesday[hpid]
+        )
+    conn.commit()
+    conn.close()
+    collector.rebuild_derived(db_file, str(tmp_path / "open_index.db"))
+
+    monkeypatch.setattr(data_loader, "SHARD_DIR", "")
+    monkeypatch.chdir(tmp_path)
+    data_loader.reload_dataset(force=True)
+    try:
+        now = datetime(2026, 10, 19, 23, 40) # Monday
+        opening = {p.hpid: p.opens_at for p in data_loader.get_places_opening_soon(30, now)}
+        closing = {p.hpid: p.closes_at for p in data_loader.get_places_closing_soon(30, now)}
+        assert opening == {"EARLY": datetime(2026, 10, 20, 0, 0)}
+        assert closing == {"LATE": datetime(2026, 10, 20, 0, 5), "EVENING": datetime(2026, 10, 19, 23, 50)}
+
+        item = {"dutyTime1s": "0000", "dutyTime1c": "2400", "dutyTime2s": "0000", "dutyTime2c": "0005"}
+        assert next_transition(item, now) == {"opens_at": None, "closes_at": datetime(2026, 10, 20, 0, 5)}
+        always = {f"dutyTime{day}{end}": hhmm for day in range(1, 9) for end, hhmm in (("s", "0000"), ("c", "2400"))}
+        assert next_transition(always, now)["closes_at"] is None
+    finally:
+        monkeypatch.undo()
+        data_loader.reload_dataset(force=True)
+
 if __name__ == "__main__":
     test_pharmacy_api() 
     test_hospital_api()
@@ -1,9 +1,59 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 import time
+import math
+import hashlib
 from workalendar.asia import SouthKorea
 
 cal = SouthKorea()
 
+# --- Administrative Divisions ---
+KOREA_ADMIN_DIVISIONS = {
+    "서울특별시": ["강남구", "강동구", "강북구", "강서구", "관악구", "광진구", "구로구", "금천구", "노원구", "도봉구", "동대문구", "동작구", "마포구", "서대문구", "서초구", "성동구", "성북구", "송파구", "양천구", "영등포구", "용산구", "은평구", "종로구", "중구", "중랑구"],
+    "경기도": ["수원시", "성남시", "의정부시", "안양시", "부천시", "광명시", "평택시", "동두천시", "안산시", "고양시", "과천시", "구리시", "남양주시", "오산시", "시흥시", "군포시", "의왕시", "하남시", "용인시", "파주시", "이천시", "안성시", "김포시", "화성시", "광주시", "양주시", "포천시", "여주시", "연천군", "가평군", "양평군"],
+    "부산광역시": ["중구", "서구", "동구", "영도구", "부산진구", "동래구", "남구", "북구", "해운대구", "사하구", "금정구", "강서구", "연제구", "수영구", "사상구", "기장군"],
+    "대구광역시": ["중구", "동구", "서구", "남구", "북구", "수성구", "달서구", "달성군", "군위군"],
+    "인천광역시": ["중구", "동구", "미추홀구", "연수구", "남동구", "부평구", "계양구", "서구", "강화군", "옹진군"],
+    "광주광역시": ["동구", "서구", "남구", "북구", "광산구"],
+    "대전광역시": ["동구", "중구", "서구", "유성구", "대덕구"],
+    "울산광역시": ["중구", "남구", "동구", "북구", "울주군"],
+    "세종특별자치시": ["세종특별자치시"],
+    "강원특별자치도": ["춘천시", "원주시", "강릉시", "동해시", "태백시", "속초시", "삼척시", "홍천군", "횡성군", "영월군", "평창군", "정선군", "철원군", "화천군", "양구군", "인제군", "고성군", "양양군"],
+    "충청북도": ["청주시", "충주시", "제천시", "보은군", "옥천군", "영동군", "증평군", "진천군", "괴산군", "음성군", "단양군"],
+    "충청남도": ["천안시", "공주시", "보령시", "아산시", "서산시", "논산시", "계룡시", "당진시", "금산군", "부여군", "서천군", "청양군", "홍성군", "예산군", "태안군"],
+    "전북특별자치도": ["전주시", "군산시", "익산시", "정읍시", "남원시", "김제시", "완주군", "진안군", "무주군", "장수군", "임실군", "순창군", "고창군", "부안군"],
+    "전라남도": ["목포시", "여수시", "순천시", "나주시", "광양시", "담양군", "곡성군", "구례군", "고흥군", "보성군", "화순군", "장흥군", "강진군", "해남군", "영암군", "무안군", "함평군", "영광군", "장성군", "완도군", "진도군", "신안군"],
+    "경상북도": ["포항시", "경주시", "김천시", "안동시", "구미시", "영주시", "영천시", "상주시", "문경시", "경산시", "의성군", "청송군", "영양군", "영덕군", "청도군", "고령군", "성주군", "칠곡군", "예천군", "봉화군", "울진군", "울릉군"],
+    "경상남도": ["창원시", "진주시", "통영시", "사천시", "김해시", "밀양시", "거제시", "양산시", "의령군", "함안군", "창녕군", "고성군", "남해군", "하동군", "산청군", "함양군", "거창군", "합천군"],
+    "제주특별자치도": ["제주시", "서귀포시"]
+}
+
+# Older province names still found in addresses
+SIDO_ALIASES = {
+    "강원도": "강원특별자치도",
+    "전라북도": "전북특별자치도",
+    "제주도": "제주특별자치도",
+    "세종시": "세종특별자치시",
+}
+
+def split_region(address):
+    """
+    Extracts (sido, sigungu) from an address like "서울특별시 강남구 ...",
+    normalized to KOREA_ADMIN_DIVISIONS names. Returns (None, None) if unknown.
+    """
+    if not address:
+        return None, None
+    tokens = str(address).split()
+    sido = SIDO_ALIASES.get(tokens[0], tokens[0])
+    districts = KOREA_ADMIN_DIVISIONS.get(sido)
+    if districts is None:
+        return None, None
+    if len(districts) == 1:
+        # 세종특별자치시 has no sigungu level
+        return sido, districts[0]
+    if len(tokens) > 1 and tokens[1] in districts:
+        return sido, tokens[1]
+    return sido, None
+
 def parse_time(time_str):
     """
     Parses a time string like '0900' or '1830' into a time object.
@@ -23,6 +73,65 @@ def parse_time(time_str):
     except:
         return None
 
+def schedule_day_index(current_datetime):
+    """
+    Returns the dutyTime column index (1-8) that applies to the given datetime.
+    Mon(0)..Sun(6) -> dutyTime1..7, public holidays -> dutyTime8.
+    """
+    if cal.is_holiday(current_datetime.date()):
+        return 8
+    return current_datetime.weekday() + 1
+
+# Week time slots for the open-facility index.
+# Slot = (dutyTime day index - 1) * SLOTS_PER_DAY + minute_of_day // SLOT_MINUTES,
+# so Mon..Sun fill slots 0-1007 and the holiday profile (dutyTime8) 1008-1151.
+SLOT_MINUTES = 10
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+NUM_SLOTS = 8 * SLOTS_PER_DAY
+
+def hhmm_to_minutes(value):
+    """
+    Converts a dutyTime value ('0930', 930) to minutes since midnight.
+    Returns None if missing or invalid.
+    """
+    if not value:
+        return None
+    try:
+        hhmm = int(value)
+    except (TypeError, ValueError):
+        return None
+    hour, minute = divmod(hhmm, 100)
+    if minute >= 60:
+        return None
+    return hour * 60 + minute
+
+def time_slot(current_datetime):
+    """Returns the open-index slot (0 - NUM_SLOTS-1) for a datetime."""
+    day_idx = schedule_day_index(current_datetime)
+    minute = current_datetime.hour * 60 + current_datetime.minute
+    return (day_idx - 1) * SLOTS_PER_DAY + minute // SLOT_MINUTES
+
+def unit_vector(lat, lon):
+    """
+    Point on the unit sphere for a coordinate. The dot product of two unit
+    vectors is the cosine of their central angle, so great-circle ranking
+    needs only multiplication and addition. Returns (None, None, None) if missing.
+    """
+    if lat is None or lon is None:
+        return None, None, None
+    lat, lon = math.radians(lat), math.radians(lon)
+    return math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat)
+
+def schedule_id(hours):
+    """
+    Id of a weekly schedule: hours are the 16 dutyTime values in
+    dutyTime1s, dutyTime1c, ..., dutyTime8c order. A 64-bit content hash, so
+    every shard and rebuild gives a schedule the same id (None == "").
+    """
+    signature = "|".join("" if value is None else str(value) for value in hours)
+    digest = hashlib.blake2b(signature.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
 def is_open_now(item, current_datetime=None):
     """
     Determines if the facility is open at the current time.
@@ -40,10 +149,7 @@ def is_open_now(item, current_datetime=None):
     if current_datetime is None:
         current_datetime = datetime.now()
     
-    # Check if holiday
-    date_only = current_datetime.date()
-    is_holiday = cal.is_holiday(date_only) or (current_datetime.weekday() == 6) # Sunday is usually treated like holiday in dutyTime8s? 
-                                                                               # Actually, API has dutyTime7 (Sun) and dutyTime8 (Holiday)
+    # API has dutyTime7 (Sun) and dutyTime8 (Holiday)
     # Re-logic:
     # Mon(0)..Sat(5) -> dutyTime1..6
     # Sun(6) -> dutyTime7
@@ -51,19 +157,10 @@ def is_open_now(item, current_datetime=None):
     
     # Official logic usually: If Public Holiday -> dutyTime8. Else -> dutyTime(weekday+1)
     
-    start_key = None
-    end_key = None
-    
-    if cal.is_holiday(date_only):
-        start_key = "dutyTime8s"
-        end_key = "dutyTime8c"
-    else:
-        weekday = current_datetime.weekday() # 0=Mon
-        day_idx = weekday + 1
-        start_key = f"dutyTime{day_idx}s"
-        end_key = f"dutyTime{day_idx}c"
+    day_idx = schedule_day_index(current_datetime)
+    start_key = f"dutyTime{day_idx}s"
+    end_key = f"dutyTime{day_idx}c"
 
-        
     start_time_str = item.get(start_key)
     end_time_str = item.get(end_key)
 
@@ -89,6 +186,90 @@ def is_open_now(item, current_datetime=None):
     else:
         return {"is_open": False, "message": "영업 종료"}
 
+TRANSITION_LOOKAHEAD_DAYS = 8 # Long enough to cover a full week plus a holiday
+DAY_END_MINUTE = 23 * 60 + 59 # hours ending at 2359 or 2400 run through midnight
+
+def get_day_hours(item, day_idx):
+    """
+    Returns (start, end) in minutes since midnight for dutyTime{day_idx},
+    or None if the facility is closed that day.
+    """
+    start = hhmm_to_minutes(item.get(f"dutyTime{day_idx}s"))
+    end = hhmm_to_minutes(item.get(f"dutyTime{day_idx}c"))
+    if start is None or end is None or start > end:
+        return None
+    return start, end
+
+def next_transition(item, current_datetime=None):
+    """
+    Finds the current or next opening period of the facility.
+
+    Returns:
+        dict: {
+            "opens_at": datetime or None (None if open now or no opening found),
+            "closes_at": datetime or None (end of the current/next opening period,
+                         the last open minute as shown in "18:00 종료"; None if
+                         it runs through the whole lookahead, e.g. 24-hour places)
+        }
+    Hours ending at 23:59/24:00 followed by hours from 00:00 are one period.
+    """
+    if current_datetime is None:
+        current_datetime = datetime.now()
+    now = current_datetime.replace(second=0, microsecond=0)
+    midnight = now.replace(hour=0, minute=0)
+
+    for offset in range(TRANSITION_LOOKAHEAD_DAYS):
+        day_start = midnight + timedelta(days=offset)
+        hours = get_day_hours(item, schedule_day_index(day_start))
+        if hours is None:
+            continue
+        start = day_start + timedelta(minutes=hours[0])
+        end = day_start + timedelta(minutes=hours[1])
+        if end < now:
+            continue
+        closes_at = _period_end(item, day_start, hours[1])
+        if start <= now:
+            return {"opens_at": None, "closes_at": closes_at}
+        return {"opens_at": start, "closes_at": closes_at}
+
+    return {"opens_at": None, "closes_at": None}
+
+def _period_end(item, day_start, end_min):
+    """
+    End of the opening period ending at end_min on day_start, followed into
+    the next days while they open at 00:00. None if it never ends within
+    TRANSITION_LOOKAHEAD_DAYS.
+    """
+    for _ in range(TRANSITION_LOOKAHEAD_DAYS):
+        if end_min < DAY_END_MINUTE:
+            return day_start + timedelta(minutes=end_min)
+        next_day = day_start + timedelta(days=1)
+        hours = get_day_hours(item, schedule_day_index(next_day))
+        if hours is None or hours[0] != 0:
+            return day_start + timedelta(minutes=end_min)
+        day_start, end_min = next_day, hours[1]
+    return None
+
+def format_next_opening(item, current_datetime=None):
+    """
+    Returns a short message about the next opening, e.g. "내일 09:00 영업 시작".
+    Returns None if the facility is open now or has no upcoming hours.
+    """
+    if current_datetime is None:
+        current_datetime = datetime.now()
+    opens_at = next_transition(item, current_datetime)["opens_at"]
+    if opens_at is None:
+        return None
+
+    days = (opens_at.date() - current_datetime.date()).days
+    if days == 0:
+        day_label = "오늘"
+    elif days == 1:
+        day_label = "내일"
+    else:
+        day_label = opens_at.strftime("%m/%d")
+    return f"{day_label} {opens_at.strftime('%H:%M')} 영업 시작"
+
 from geopy.geocoders import Nominatim
 from geopy.exc import GeocoderTimedOut, GeocoderServiceError
 